@@ -0,0 +1,51 @@
+# Adaptive sample interval, between the configured delay and max_delay (seconds).
+# While power and voltage stay inside their deadband the interval doubles, up to max_delay, and
+# the moment either moves outside it the interval drops back to the configured delay.
+# A low battery (vsys percentage) also stretches the interval, whatever the readings do.
+class AdaptiveRate:
+    def __init__(self, min_delay : int = 30, max_delay : int = 300, power_band : float = .01, voltage_band : float = .05, low_battery : float = 30):
+        self.power_band = power_band        # watts
+        self.voltage_band = voltage_band    # volts
+        self.low_battery = low_battery      # percent
+        self.configure(min_delay, max_delay)
+
+    def configure(self, min_delay : int, max_delay : int):
+        self.min_delay = min_delay
+        self.max_delay = max(max_delay, min_delay)
+        self.delay = min_delay
+        self.reason = 'start'
+        self.changes = 0
+        self._power = None
+        self._voltage = None
+
+    def update(self, power : float, voltage : float, battery : float) -> int:
+        # returns the delay until the next sample, in seconds
+        moved = (self._power is None
+                 or abs(power - self._power) > self.power_band
+                 or abs(voltage - self._voltage) > self.voltage_band)
+        if moved:
+            # the reference only follows the readings when they move, so a slow drift still adds up to a change
+            self._power = power
+            self._voltage = voltage
+        delay = self.delay
+        if battery < self.low_battery:
+            delay = min(delay * 2, self.max_delay)
+            self.reason = 'low battery'
+        elif moved:
+            delay = self.min_delay
+            self.reason = 'changing'
+        else:
+            delay = min(delay * 2, self.max_delay)
+            self.reason = 'stable'
+        if delay != self.delay:
+            self.changes += 1
+            self.delay = delay
+        return delay
+
+    def stats(self) -> dict:
+        return {
+            'delay': self.delay,
+            'rate_per_min': 60 / self.delay,
+            'reason': self.reason,
+            'changes': self.changes,
+        }
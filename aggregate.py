@@ -0,0 +1,114 @@
+from array import array
+import asyncio
+import math
+from clock import ticks_ms, ticks_add, ticks_diff
+
+# Oversampling window for the INA219 readings: voltage, current and power are read many times per sample
+# interval into preallocated float arrays, and summarised once per interval as min/max/mean/stddev.
+# add() only stores into the arrays, so the fast read loop doesn't build lists or stats objects, the
+# summary is computed in one go when the interval ends.
+CHANNELS = ('voltage', 'current', 'power')
+
+class Window:
+    def __init__(self, capacity : int = 64):
+        self.capacity = capacity
+        self.count = 0
+        self.dropped = 0
+        self._voltage = array('f', bytearray(4 * capacity))
+        self._current = array('f', bytearray(4 * capacity))
+        self._power = array('f', bytearray(4 * capacity))
+
+    def add(self, voltage : float, current : float, power : float):
+        index = self.count
+        if index >= self.capacity:
+            self.dropped += 1
+            return
+        self._voltage[index] = voltage
+        self._current[index] = current
+        self._power[index] = power
+        self.count = index + 1
+
+    def reset(self):
+        self.count = 0
+
+    def _summary(self, values : array) -> tuple:
+        count = self.count
+        low = high = total = values[0]
+        for i in range(1, count):
+            value = values[i]
+            total += value
+            if value < low:
+                low = value
+            elif value > high:
+                high = value
+        mean = total / count
+        squares = 0.0
+        for i in range(count):
+            squares += (values[i] - mean) ** 2
+        return low, high, mean, math.sqrt(squares / count)
+
+    def summary(self) -> dict:
+        # {channel: (min, max, mean, stddev)} for the readings so far, None when there are none
+        if self.count == 0:
+            return None
+        return {
+            'voltage': self._summary(self._voltage),
+            'current': self._summary(self._current),
+            'power': self._summary(self._power),
+        }
+
+async def fill(window : Window, read, reads : int, period_ms : int, running = None):
+    # await read() -> (voltage, current, power) reads times, evenly spread over the next period_ms.
+    # each read starts at its own deadline from the start, so the time a read takes (a triggered INA219
+    # conversion can take 140 ms) doesn't push the rest back, a late read starts straight away, and
+    # nothing is read once period_ms is up.
+    # running() is checked before each read and at least every second while waiting, the fill stops
+    # as soon as it returns False (monitoring stopped or restarted)
+    start = ticks_ms()
+    spacing = period_ms // reads
+    for i in range(reads):
+        while True:
+            if running is not None and not running():
+                return
+            delay = ticks_diff(ticks_add(start, i * spacing), ticks_ms())
+            if delay <= 0:
+                break
+            await asyncio.sleep(min(delay, 1000) / 1000)
+        if i > 0 and ticks_diff(ticks_ms(), start) >= period_ms:
+            break
+        voltage, current, power = await read()
+        window.add(voltage, current, power)
+
+if __name__ == "__main__":
+    # check the summary against the statistics module, using a fake INA219: PYTHONPATH=host python3 aggregate.py
+    import random
+    import statistics
+
+    class FakeINA219:
+        def __init__(self):
+            self.readings = []
+
+        def voltage(self) -> float:
+            value = random.uniform(5.5, 6.5)
+            self.readings.append(value + .8)
+            return value
+
+        def current(self) -> float:
+            return random.uniform(100, 300)
+
+        def power(self) -> float:
+            return random.uniform(600, 1800)
+
+        async def read(self) -> tuple:
+            return self.voltage() + .8, self.current() / 1000, self.power() / 1000
+
+    ina = FakeINA219()
+    window = Window(64)
+    asyncio.run(fill(window, ina.read, 50, 500))
+    low, high, mean, stddev = window.summary()['voltage']
+    expected = ina.readings
+    assert window.count == 50
+    assert abs(low - min(expected)) < 1e-5 and abs(high - max(expected)) < 1e-5
+    assert abs(mean - statistics.fmean(expected)) < 1e-5
+    assert abs(stddev - statistics.pstdev(expected)) < 1e-5
+    print(f'voltage min {low:.3f} max {high:.3f} mean {mean:.3f} stddev {stddev:.4f} over {window.count} reads')
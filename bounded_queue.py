@@ -0,0 +1,41 @@
+import asyncio
+
+# Fixed size queue between asyncio tasks (MicroPython's asyncio has no Queue).
+# put() never blocks, so a producer like the sampler is never held up by a slow consumer,
+# when the queue is full the oldest item is dropped and counted.
+class BoundedQueue:
+    def __init__(self, size : int):
+        self._items = [None] * size
+        self._head = 0
+        self._count = 0
+        self._event = asyncio.Event()
+        self.dropped = 0
+
+    def put(self, item):
+        size = len(self._items)
+        if self._count == size:
+            self._items[self._head] = None
+            self._head = (self._head + 1) % size
+            self._count -= 1
+            self.dropped += 1
+        self._items[(self._head + self._count) % size] = item
+        self._count += 1
+        self._event.set()
+
+    def get_nowait(self):
+        if self._count == 0:
+            raise IndexError('queue empty')
+        item = self._items[self._head]
+        self._items[self._head] = None
+        self._head = (self._head + 1) % len(self._items)
+        self._count -= 1
+        return item
+
+    async def get(self):
+        while self._count == 0:
+            self._event.clear()
+            await self._event.wait()
+        return self.get_nowait()
+
+    def qsize(self) -> int:
+        return self._count
@@ -0,0 +1,57 @@
+import asyncio
+import micropython
+from machine import Pin
+from clock import ticks_ms, ticks_diff
+
+# Push button between a GPIO pin and ground, using the internal pull up, so a press is a falling edge.
+# Nothing is done in the interrupt beyond ignoring edges within debounce_ms of the last one it let
+# through, the edge is handed to micropython.schedule, and the scheduled callback only sets a flag.
+# pressed() waits for the flag, then checks the pin is still low debounce_ms later, which filters out
+# the falling edges a contact makes when it bounces on release.
+try:
+    _Flag = asyncio.ThreadSafeFlag
+except AttributeError:
+    _Flag = asyncio.Event   # CPython (host testing)
+
+class Button:
+    def __init__(self, pin : int, debounce_ms : int = 30):
+        self.debounce_ms = debounce_ms
+        self.presses = 0
+        self.bounces = 0            # edges that weren't a press
+        self.missed = 0             # edges lost because the schedule queue was full
+        self._last = ticks_ms()
+        self._flag = _Flag()
+        self._scheduled = self._edge    # bound once, making it in the interrupt would allocate
+        self.pin = Pin(pin, Pin.IN, Pin.PULL_UP)
+        self.pin.irq(handler=self._irq, trigger=Pin.IRQ_FALLING)
+
+    def _irq(self, pin):
+        now = ticks_ms()
+        if ticks_diff(now, self._last) < self.debounce_ms:
+            return
+        self._last = now
+        try:
+            micropython.schedule(self._scheduled, 0)
+        except RuntimeError:
+            self.missed += 1
+
+    def _edge(self, _):
+        self._flag.set()
+
+    async def pressed(self) -> bool:
+        # waits for the next falling edge, returns whether it was a press
+        await self._flag.wait()
+        self._flag.clear()
+        await asyncio.sleep(self.debounce_ms / 1000)
+        if self.pin.value() == 0:
+            self.presses += 1
+            return True
+        self.bounces += 1
+        return False
+
+    def stats(self) -> dict:
+        return {
+            'presses': self.presses,
+            'bounces': self.bounces,
+            'missed': self.missed,
+        }
@@ -0,0 +1,20 @@
+# tick counter helpers, MicroPython has these in time, CPython (host testing) does not
+try:
+    from time import ticks_ms, ticks_us, ticks_diff, ticks_add, sleep_ms
+except ImportError:
+    import time as _time
+
+    def ticks_ms() -> int:
+        return int(_time.monotonic() * 1000)
+
+    def ticks_us() -> int:
+        return int(_time.monotonic() * 1000000)
+
+    def ticks_diff(new : int, old : int) -> int:
+        return new - old
+
+    def ticks_add(ticks : int, delta : int) -> int:
+        return ticks + delta
+
+    def sleep_ms(ms : int):
+        _time.sleep(ms / 1000)
@@ -0,0 +1,65 @@
+# Change only reporting: a reading is only uploaded when it has moved outside its deadband since the
+# value last uploaded, or when it hasn't been uploaded for heartbeat samples (so a flat line at night
+# still shows up in grafana, and a gap means the monitor is down rather than nothing changed).
+# A band is (absolute, relative), the reading has changed when it differs from the last uploaded
+# value by more than the larger of absolute and relative * |last|. Fields without a band always pass.
+BANDS = {
+    'voltage': (.05, .01),          # volts
+    'current': (.001, .02),         # amps
+    'power': (.005, .02),           # watts
+    'temperature': (.5, 0),         # fahrenheit
+    'vsys': (.02, 0),               # volts
+    'battery': (1, 0),              # percent
+    'freemem': (4096, 0),           # bytes
+    'energy_today': (.01, 0),       # watt-hours
+    'charge_today': (1, 0),         # milliamp-hours
+    'energy_total': (.01, 0),
+    'charge_total': (1, 0),
+}
+
+class Deadband:
+    def __init__(self, bands : dict = None, heartbeat : int = 10):
+        self.bands = dict(BANDS if bands is None else bands)
+        self.heartbeat = heartbeat      # samples, a field is sent at least this often
+        self.passed = 0
+        self.suppressed = 0
+        self.reset()
+
+    def reset(self):
+        # forget the last uploaded values, the next sample is sent in full
+        self._last = {}
+        self._skipped = {}
+
+    def set_band(self, name : str, absolute : float, relative : float = 0):
+        self.bands[name] = (absolute, relative)
+
+    def changed(self, name : str, value) -> bool:
+        band = self.bands.get(name)
+        last = self._last.get(name)
+        if band is None or last is None or self._skipped[name] + 1 >= self.heartbeat:
+            return True
+        absolute, relative = band
+        return abs(value - last) > max(absolute, relative * abs(last))
+
+    def filter(self, readings : dict) -> dict:
+        # the readings to upload, an empty dict when nothing changed
+        passed = {}
+        for name, value in readings.items():
+            if self.changed(name, value):
+                passed[name] = value
+                self._last[name] = value
+                self._skipped[name] = 0
+            else:
+                self._skipped[name] += 1
+        self.passed += len(passed)
+        self.suppressed += len(readings) - len(passed)
+        return passed
+
+    def stats(self) -> dict:
+        total = self.passed + self.suppressed
+        return {
+            'heartbeat': self.heartbeat,
+            'passed': self.passed,
+            'suppressed': self.suppressed,
+            'reduction': self.suppressed / total if total > 0 else 0,
+        }
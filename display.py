@@ -0,0 +1,190 @@
+from clock import ticks_ms, ticks_diff
+
+# Dashboard on the SSD1306, in pages: the live readings, the energy totals and the system state, with
+# the wifi/influx link state along the bottom of each.
+#
+# The labels, units and divider lines of a page are drawn once. Each value field has a fixed position and
+# width (worked out once in the page's fields), and keeps the text it last drew, so a frame only clears and
+# redraws the fields whose text changed. With the driver's dirty page tracking, only those bytes go over I2C.
+# update() just stores the newest values, render() draws at the display's own pace, so samples
+# arriving faster than the refresh are coalesced into one frame and drawing never holds up sampling.
+#
+# The panel draws a few mA while it is lit, so sleep_if_idle() turns it off (poweroff(), the panel keeps
+# its memory) when nobody has pressed the button for a while, and press() turns it back on. The time it
+# was on and the number of wakes are kept so the saving shows up in the stats.
+LINK = ('link', 0, 56, 16, '{:<16}')
+FIELDS = (
+    # name, x, y, characters, format
+    ('location', 0, 0, 16, '{}'),
+    ('voltage', 0, 14, 7, '{:7.2f}'),
+    ('current', 0, 24, 7, '{:7.1f}'),
+    ('power', 0, 34, 7, '{:7.1f}'),
+    ('battery', 0, 44, 7, '{:7.0f}'),
+    LINK,
+)
+LABELS = (
+    # text, x, y
+    ('V', 64, 14),
+    ('mA', 64, 24),
+    ('mW', 64, 34),
+    ('% bat', 64, 44),
+)
+ENERGY_FIELDS = (
+    ('energy_today', 0, 14, 7, '{:7.2f}'),
+    ('charge_today', 0, 24, 7, '{:7.0f}'),
+    ('energy_total', 0, 34, 7, '{:7.1f}'),
+    ('charge_total', 0, 44, 7, '{:7.0f}'),
+    LINK,
+)
+ENERGY_LABELS = (
+    ('energy', 0, 0),
+    ('Wh day', 64, 14),
+    ('mAh day', 64, 24),
+    ('Wh all', 64, 34),
+    ('mAh all', 64, 44),
+)
+SYSTEM_FIELDS = (
+    ('state', 0, 14, 10, '{:<10}'),
+    ('samples', 0, 24, 7, '{:7d}'),
+    ('period', 0, 34, 7, '{:7.0f}'),
+    ('free_kb', 0, 44, 7, '{:7.0f}'),
+    LINK,
+)
+SYSTEM_LABELS = (
+    ('system', 0, 0),
+    ('samples', 64, 24),
+    ('s period', 64, 34),
+    ('KB free', 64, 44),
+)
+PAGES = ((FIELDS, LABELS), (ENERGY_FIELDS, ENERGY_LABELS), (SYSTEM_FIELDS, SYSTEM_LABELS))
+SCALE = {'current': 1000, 'power': 1000}    # amps and watts shown as mA and mW
+
+class Dashboard:
+    def __init__(self, display):
+        self.display = display
+        self._values = {}
+        self._texts = {}
+        self._drawn = False
+        self._pending = False
+        self.page = 0
+        self.on = True
+        self.frames = 0
+        self.coalesced = 0
+        self.wakes = 0
+        self.sleeps = 0
+        self._on_ms = 0             # lit time up to the last poweroff
+        self._started = ticks_ms()
+        self._lit = self._started   # when it was last turned on
+        self._active = self._started
+
+    def update(self, readings : dict, location : str, link : str):
+        if self._pending and self.on:
+            self.coalesced += 1     # the previous sample was never drawn
+        values = self._values
+        for name, scale in SCALE.items():
+            values[name] = readings[name] * scale
+        values['voltage'] = readings['voltage']
+        values['battery'] = readings['battery']
+        values['location'] = location
+        values['link'] = link
+        self._pending = True
+
+    def update_values(self, values : dict):
+        # values for the other pages' fields, by field name
+        self._values.update(values)
+        self._pending = True
+
+    def invalidate(self):
+        # everything is redrawn on the next render, e.g. after something else used the screen
+        self._drawn = False
+        self._pending = True
+
+    def press(self):
+        # a button press turns the panel on, or when it is already on shows the next page
+        self._active = ticks_ms()
+        if not self.on:
+            self.wake()
+        else:
+            self.page = (self.page + 1) % len(PAGES)
+            self.invalidate()
+
+    def wake(self):
+        self.display.poweron()
+        self.on = True
+        self.wakes += 1
+        self._lit = ticks_ms()
+        self._active = self._lit
+        self._pending = True
+
+    def sleep(self):
+        self.display.poweroff()
+        self.on = False
+        self.sleeps += 1
+        self._on_ms += ticks_diff(ticks_ms(), self._lit)
+
+    def sleep_if_idle(self, timeout : int) -> bool:
+        # turns the panel off timeout seconds after the last press (0 leaves it on), returns whether it did
+        if self.on and timeout > 0 and ticks_diff(ticks_ms(), self._active) >= timeout * 1000:
+            self.sleep()
+            return True
+        return False
+
+    def render(self) -> bool:
+        # draws and shows a frame if there is anything new and the panel is on, returns whether it did
+        if not self._pending or not self.on:
+            return False
+        display = self.display
+        fields, labels = PAGES[self.page]
+        if not self._drawn:
+            display.fill(0)
+            for text, x, y in labels:
+                display.text(text, x, y)
+            display.hline(0, 10, display.width, 1)
+            display.hline(0, 53, display.width, 1)
+            self._texts = {}
+            self._drawn = True
+        for name, x, y, characters, format in fields:
+            if name not in self._values:
+                continue
+            text = format.format(self._values[name])[:characters]
+            if self._texts.get(name) != text:
+                display.fill_rect(x, y, characters * 8, 8, 0)
+                display.text(text, x, y)
+                self._texts[name] = text
+        display.show()
+        self._pending = False
+        self.frames += 1
+        return True
+
+    def stats(self) -> dict:
+        now = ticks_ms()
+        on_ms = self._on_ms
+        if self.on:
+            on_ms += ticks_diff(now, self._lit)
+        elapsed = ticks_diff(now, self._started)
+        return {
+            'frames': self.frames,
+            'coalesced': self.coalesced,
+            'page': self.page,
+            'on': self.on,
+            'on_seconds': on_ms // 1000,
+            'on_percent': on_ms * 100 // elapsed if elapsed > 0 else 100,
+            'wakes': self.wakes,
+            'sleeps': self.sleeps,
+        }
+
+def write_pbm(display, path : str):
+    # the frame buffer as a binary PBM image (1 is black, so lit pixels come out black on white)
+    width = display.width
+    row = bytearray((width + 7) // 8)
+    with open(path, 'wb') as f:
+        f.write(f'P4\n{width} {display.height}\n'.encode())
+        for y in range(display.height):
+            page = (y >> 3) * width
+            bit = 1 << (y & 7)
+            for i in range(len(row)):
+                row[i] = 0
+            for x in range(width):
+                if display.buffer[page + x] & bit:
+                    row[x >> 3] |= 0x80 >> (x & 7)
+            f.write(row)
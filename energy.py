@@ -0,0 +1,93 @@
+import json
+import os
+import time
+from clock import ticks_ms, ticks_diff
+
+# Harvested energy (Wh) and charge (mAh), integrated from the power and current samples with the
+# trapezoid rule. Sample spacing comes from the tick counter, not the RTC, so an NTP correction of
+# the clock can't stretch or shrink the integral. The RTC is only used to notice a new day.
+# Totals are saved to flash every save_interval seconds (and on stop) so they survive a reboot.
+class EnergyCounter:
+    def __init__(self, path : str = 'energy.json', save_interval : int = 600, max_gap : int = 600):
+        self.path = path
+        self.save_interval = save_interval
+        self.max_gap = max_gap          # seconds, samples further apart than this aren't integrated across
+        self._min_gap = max_gap
+        self.today_wh = 0.0
+        self.today_mah = 0.0
+        self.total_wh = 0.0
+        self.total_mah = 0.0
+        self.day = None
+        self._last_ticks = None
+        self._last_power = 0.0
+        self._last_current = 0.0
+        self._saved = ticks_ms()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.total_wh = saved.get('total_wh', 0.0)
+        self.total_mah = saved.get('total_mah', 0.0)
+        day = saved.get('day')
+        if day is not None and tuple(day) == time.localtime()[:3]:
+            self.day = tuple(day)
+            self.today_wh = saved.get('today_wh', 0.0)
+            self.today_mah = saved.get('today_mah', 0.0)
+
+    def save(self):
+        # write a new file then rename it over the old one, so a reset mid write can't lose the totals
+        saved = {'day': self.day, 'today_wh': self.today_wh, 'today_mah': self.today_mah,
+                 'total_wh': self.total_wh, 'total_mah': self.total_mah}
+        try:
+            with open(self.path + '.tmp', 'w') as f:
+                json.dump(saved, f)
+            os.rename(self.path + '.tmp', self.path)
+        except OSError as e:
+            print(f'energy save failed {e}')
+        self._saved = ticks_ms()
+
+    def set_interval(self, seconds : int):
+        # the sample interval in use, two missed samples count as a gap, but never less than max_gap
+        self.max_gap = max(self._min_gap, 2 * seconds)
+
+    def pause(self):
+        # monitoring stopped, the next sample starts a new run instead of integrating over the gap
+        self._last_ticks = None
+        self.save()
+
+    def add(self, power : float, current : float, ticks : int = None):
+        # power in watts, current in amps
+        if ticks is None:
+            ticks = ticks_ms()
+        day = time.localtime()[:3]
+        if day != self.day:
+            self.day = day
+            self.today_wh = 0.0
+            self.today_mah = 0.0
+        if self._last_ticks is not None:
+            elapsed = ticks_diff(ticks, self._last_ticks)
+            if 0 < elapsed <= self.max_gap * 1000:
+                hours = elapsed / 3600000
+                wh = (power + self._last_power) / 2 * hours
+                mah = (current + self._last_current) / 2 * hours * 1000
+                self.today_wh += wh
+                self.today_mah += mah
+                self.total_wh += wh
+                self.total_mah += mah
+        self._last_ticks = ticks
+        self._last_power = power
+        self._last_current = current
+        if ticks_diff(ticks, self._saved) >= self.save_interval * 1000:
+            self.save()
+
+    def stats(self) -> dict:
+        return {
+            'energy_today': self.today_wh,
+            'charge_today': self.today_mah,
+            'energy_total': self.total_wh,
+            'charge_total': self.total_mah,
+        }
@@ -0,0 +1,84 @@
+from array import array
+
+# Recent samples kept on the device, so the last few hours can be looked at while influx is unreachable.
+# A ring of capacity samples in preallocated arrays (unix seconds, and a float per channel), so memory
+# stays the same however long the monitor runs: 720 samples is 6 hours at the default 30s delay, in
+# about 14KB. Once full each new sample overwrites the oldest.
+CHANNELS = ('voltage', 'current', 'power', 'battery')
+
+class History:
+    def __init__(self, capacity : int = 720, channels : tuple = CHANNELS):
+        self.capacity = capacity
+        self.channels = channels
+        self.times = array('I', bytearray(4 * capacity))
+        self.values = [array('f', bytearray(4 * capacity)) for channel in channels]
+        self.count = 0
+        self._next = 0      # index the next sample is written to
+
+    def add(self, seconds : int, readings : dict):
+        index = self._next
+        self.times[index] = seconds
+        for channel, values in zip(self.channels, self.values):
+            values[index] = readings[channel]
+        self._next = (index + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def reset(self):
+        self.count = 0
+        self._next = 0
+
+    def query(self, since : int = None, step : int = 0, max_points : int = 240) -> dict:
+        # samples from unix time since on (negative is seconds before the newest sample), averaged
+        # into step second buckets. step 0 returns every sample, and step grows when there would be
+        # more than max_points buckets
+        result = {'step': step, 'time': []}
+        for channel in self.channels:
+            result[channel] = []
+        if self.count == 0:
+            return result
+        oldest = (self._next - self.count) % self.capacity
+        newest = self.times[(self._next - 1) % self.capacity]
+        if since is None:
+            since = 0
+        elif since < 0:
+            since = newest + since
+        # skip to the first sample at or after since, the times only ever increase around the ring
+        skip = 0
+        while skip < self.count and self.times[(oldest + skip) % self.capacity] < since:
+            skip += 1
+        count = self.count - skip
+        if count == 0:
+            return result
+        span = newest - self.times[(oldest + skip) % self.capacity]
+        if step <= 0 and count > max_points:
+            step = 1
+        if step > 0 and span // step >= max_points:
+            step = span // (max_points - 1) + 1
+        result['step'] = step
+
+        times = result['time']
+        columns = [result[channel] for channel in self.channels]
+        sums = [0.0] * len(self.channels)
+        bucket = None
+        samples = 0
+        for i in range(skip, self.count + 1):
+            if i < self.count:
+                index = (oldest + i) % self.capacity
+                seconds = self.times[index]
+                key = seconds - seconds % step if step > 0 else seconds
+            else:
+                key = None      # past the newest sample, close the last bucket
+            if key != bucket and samples > 0:
+                times.append(bucket)
+                for c in range(len(columns)):
+                    columns[c].append(round(sums[c] / samples, 4))
+                    sums[c] = 0.0
+                samples = 0
+            if key is None:
+                break
+            bucket = key
+            for c in range(len(columns)):
+                sums[c] += self.values[c][index]
+            samples += 1
+        return result
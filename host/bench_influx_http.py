@@ -0,0 +1,47 @@
+# Influx write throughput, a new connection per write (the urequests path) against the keep-alive HttpClient.
+#   PYTHONPATH=.:host python3 host/bench_influx_http.py [writes]
+import asyncio
+import sys
+import time
+import urequests
+from fake_influx import FakeInflux
+from http_client import HttpClient
+
+BODY = '\n'.join(f'voltage,location=test,measurement=voltage,units=Volt value={6 + i / 100} {1700000000000 + i}' for i in range(10))
+
+async def run(name : str, write, count : int):
+    latencies = []
+    start = time.perf_counter()
+    for i in range(count):
+        t = time.perf_counter()
+        status = await write()
+        latencies.append((time.perf_counter() - t) * 1000)
+        assert status == 204, status
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    print(f'{name:<24} {count / elapsed:8.0f} writes/s   mean {sum(latencies) / count:6.3f} ms'
+          f'   p50 {latencies[count // 2]:6.3f} ms   p99 {latencies[int(count * .99)]:6.3f} ms')
+
+async def main(count : int):
+    influx = FakeInflux(0).start()
+    path = '/api/v2/write?org=host&bucket=solar&precision=ms'
+    headers = {'Authorization': 'Token host', 'Content-Type': 'text/plain; charset=utf-8', 'Accept': 'application/json'}
+    header_block = ''.join(f'{name}: {value}\r\n' for name, value in headers.items()).encode()
+
+    async def write_urequests():
+        response = urequests.post(influx.url + path, headers=headers, data=BODY)
+        response.close()
+        return response.status_code
+
+    per_write = HttpClient(influx.url, keepalive=False)
+    keepalive = HttpClient(influx.url)
+
+    await run('urequests', write_urequests, count)
+    await run('HttpClient close', lambda: per_write.post(path, header_block, BODY), count)
+    await run('HttpClient keep-alive', lambda: keepalive.post(path, header_block, BODY), count)
+    print(f'keep-alive connections opened {keepalive.connects} for {keepalive.requests} writes')
+    keepalive.close()
+    influx.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 500))
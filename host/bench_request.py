@@ -0,0 +1,72 @@
+# Request parsing, the original decode and split Request against the memoryview parser in server.py.
+# Reports parse time and the memory allocated while parsing (tracemalloc peak) for a few typical requests.
+#   PYTHONPATH=.:host python3 host/bench_request.py [parses]
+import sys
+import time
+import tracemalloc
+from server import Request
+
+class LegacyRequest:
+    # server.Request as it was before the memoryview parser
+    def __init__(self, request : bytes):
+        self.verb : str = ''
+        self.requestline : str = ''
+        self.command : str = ''
+        self.parameters : dict[str,str] = {}
+        self.headers : dict[str,str] = {}
+
+        if len(request) > 0:
+            lines = request.decode('utf-8').split('\r\n')
+            parts = lines[0].split(' ')
+            self.verb = parts[0]
+            self.requestline = parts[1]
+            parts = self.requestline.split('?')
+            self.command = parts[0]
+            if len(parts) > 1:
+                params = parts[1].split('&')
+                for nvps in params:
+                    nvp = nvps.split('=')
+                    if len(nvp) > 1:
+                        self.parameters[nvp[0].lower()] = nvp[1].strip()
+                    elif len(nvp) == 1:
+                        self.parameters[nvp[0].lower()] = ''
+
+            for header in range(1,len(lines)):
+                parts = lines[header].split(':')
+                if len(parts) > 1:
+                    self.headers[parts[0]] = parts[1].strip()
+
+REQUESTS = {
+    'curl status': b'GET /status HTTP/1.1\r\nHost: 192.168.86.24\r\nUser-Agent: curl/8.4.0\r\nAccept: */*\r\n\r\n',
+    'config': b'GET /config?location=back%20yard&delay=30&oversample=8&layout=fields HTTP/1.1\r\nHost: 192.168.86.24\r\n'
+              b'User-Agent: curl/8.4.0\r\nAccept: */*\r\n\r\n',
+    'browser page': b'GET / HTTP/1.1\r\nHost: 192.168.86.24\r\nConnection: keep-alive\r\nCache-Control: max-age=0\r\n'
+                    b'Upgrade-Insecure-Requests: 1\r\nUser-Agent: Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) '
+                    b'Chrome/120.0.0.0 Safari/537.36\r\nAccept: text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,'
+                    b'image/webp,*/*;q=0.8\r\nAccept-Encoding: gzip, deflate\r\nAccept-Language: en-US,en;q=0.9\r\n'
+                    b'If-None-Match: "a0a750e7-7f3"\r\nCookie: state=ready&location=test&delay=30\r\n\r\n',
+}
+
+def measure(parse, data, count : int) -> tuple[float, int]:
+    # (microseconds per parse, peak bytes allocated by one parse)
+    start = time.perf_counter()
+    for i in range(count):
+        parse(data)
+    elapsed = (time.perf_counter() - start) / count * 1e6
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    parse(data)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    for name, data in REQUESTS.items():
+        buffer = bytearray(2048)
+        buffer[:len(data)] = data
+        view = memoryview(buffer)[:len(data)]     # as the server hands it over, a view of the receive buffer
+        old_us, old_peak = measure(LegacyRequest, data, count)
+        new_us, new_peak = measure(Request, view, count)
+        print(f'{name:<13} {len(data):4} bytes   legacy {old_us:6.2f} us {old_peak:5} bytes allocated'
+              f'   memoryview {new_us:6.2f} us {new_peak:5} bytes allocated')
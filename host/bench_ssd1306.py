@@ -0,0 +1,113 @@
+# SSD1306 bytes on the I2C bus per status screen update, full buffer against dirty pages and frame diff.
+# The fake bus plays the transfers into a copy of the panel's memory, which is checked against the
+# driver's buffer after every update.
+#   PYTHONPATH=.:host python3 host/bench_ssd1306.py [updates]
+import random
+import sys
+from ssd1306 import SSD1306_I2C
+
+class FakePanelI2C:
+    # counts transfers and bytes (including the address byte), keeps the panel memory they write
+    def __init__(self, width : int = 128, height : int = 64):
+        self.width = width
+        self.ram = bytearray(width * height // 8)
+        self.transfers = 0
+        self.bytes = 0
+        self._commands = []
+        self._window = (0, width - 1, 0, height // 8 - 1)
+        self._column = 0
+        self._page = 0
+
+    def _command(self, byte : int):
+        self._commands.append(byte)
+        command = self._commands
+        if command[0] in (0x21, 0x22) and len(command) == 3:
+            x0, x1, p0, p1 = self._window
+            if command[0] == 0x21:
+                x0, x1 = command[1], command[2]
+            else:
+                p0, p1 = command[1], command[2]
+            self._window = (x0, x1, p0, p1)
+            self._column = x0
+            self._page = p0
+            self._commands = []
+        elif command[0] not in (0x21, 0x22) and len(command) == 1 and command[0] not in (0x20, 0x81, 0xA8, 0xD3, 0xDA, 0xD5, 0xD9, 0xDB, 0x8D):
+            self._commands = []
+        elif command[0] not in (0x21, 0x22) and len(command) == 2:
+            self._commands = []     # command with one argument
+
+    def _data(self, data):
+        x0, x1, p0, p1 = self._window
+        for byte in data:
+            self.ram[self._page * self.width + self._column] = byte
+            self._column += 1
+            if self._column > x1:
+                self._column = x0
+                self._page = p0 if self._page >= p1 else self._page + 1
+
+    def writeto(self, addr : int, buf, stop : bool = True):
+        self.transfers += 1
+        self.bytes += 1 + len(buf)
+        if buf[0] == 0x80:
+            self._command(buf[1])
+        elif buf[0] == 0x00:
+            for byte in bytes(buf[1:]):
+                self._command(byte)
+        elif buf[0] == 0x40:
+            self._data(bytes(buf[1:]))
+
+    def writevto(self, addr : int, vector, stop : bool = True):
+        self.transfers += 1
+        self.bytes += 1 + sum(len(part) for part in vector)
+        if bytes(vector[0]) == b'\x40':
+            self._data(bytes(vector[1]))
+
+def status_screen(display, readings : dict):
+    # the screen main.py draws, everything redrawn from a blank buffer
+    display.fill(0)
+    display.text('test', 0, 0)
+    display.text(f"{readings['voltage']:.2f} V", 0, 16)
+    display.text(f"{readings['current'] * 1000:.1f} mA", 0, 28)
+    display.text(f"{readings['power'] * 1000:.1f} mW", 0, 40)
+    display.text(f"bat {readings['battery']:.0f}%", 0, 52)
+
+def values_only(display, readings : dict):
+    # labels drawn once, each update only clears and redraws the value fields
+    for y, text in ((16, f"{readings['voltage']:.2f}"), (28, f"{readings['current'] * 1000:.1f}"),
+                    (40, f"{readings['power'] * 1000:.1f}"), (52, f"{readings['battery']:.0f}")):
+        display.fill_rect(32, y, 48, 8, 0)
+        display.text(text, 32, y)
+
+def run(name : str, draw, diff : bool, full : bool, updates : int):
+    random.seed(1)
+    bus = FakePanelI2C()
+    display = SSD1306_I2C(128, 64, bus, diff=diff)
+    if draw is values_only:
+        display.fill(0)
+        for y, label in ((16, 'V'), (28, 'mA'), (40, 'mW'), (52, '%')):
+            display.text(label, 88, y)
+        display.show()
+    transfers = bus.transfers
+    sent = bus.bytes
+    readings = {'voltage': 6.5, 'current': .25, 'power': 1.6, 'battery': 80}
+    for i in range(updates):
+        readings['voltage'] += random.uniform(-.01, .01)
+        readings['current'] += random.uniform(-.001, .001)
+        readings['power'] = readings['voltage'] * readings['current']
+        if i % 20 == 0:
+            readings['battery'] += 1
+        draw(display, readings)
+        display.show(full)
+        assert bus.ram == display.buffer, f'{name}: panel differs from the buffer after update {i}'
+    per_update = (bus.bytes - sent) / updates
+    # 9 clocks per byte (8 bits and the ack) at 400kHz
+    print(f'{name:<28} {per_update:7.1f} bytes {(bus.transfers - transfers) / updates:5.1f} transfers per update'
+          f'   ~{per_update * 9 / 400:5.2f} ms at 400kHz   {display.stats()}')
+
+if __name__ == "__main__":
+    updates = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    run('full screen, full buffer', status_screen, False, True, updates)
+    run('full screen, dirty pages', status_screen, False, False, updates)
+    run('full screen, frame diff', status_screen, True, False, updates)
+    run('values only, dirty pages', values_only, False, False, updates)
+    run('values only, frame diff', values_only, True, False, updates)
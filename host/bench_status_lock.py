@@ -0,0 +1,93 @@
+# Status read contention with threads: reader threads polling the config, state and counter while a
+# writer counts samples and another thread blinks the LED, for the original lock around every getter
+# (and held through the blink) against the snapshot Status.
+#   PYTHONPATH=.:host python3 host/bench_status_lock.py [seconds]
+import os
+import sys
+import tempfile
+import threading
+import time
+import _thread
+
+class LockedStatus:
+    # the getters as they were, every one takes the lock, and status_blink holds it while it sleeps
+    def __init__(self, lock):
+        self.lock = lock
+        self.state = 'monitoring'
+        self.location = 'test'
+        self.delay = 30
+        self.data_count = 0
+
+    def get_state(self) -> str:
+        self.lock.acquire()
+        state = self.state
+        self.lock.release()
+        return state
+
+    def get_config(self) -> tuple[str,int]:
+        self.lock.acquire()
+        location = self.location
+        delay = self.delay
+        self.lock.release()
+        return location, delay
+
+    def get_data_count(self) -> int:
+        self.lock.acquire()
+        count = self.data_count
+        self.lock.release()
+        return count
+
+    def increment_counter(self) -> int:
+        self.lock.acquire()
+        self.data_count += 1
+        count = self.data_count
+        self.lock.release()
+        return count
+
+    def status_blink(self, count : int = 1, toggle_delay : float = .2, end_delay : float = 2):
+        self.lock.acquire()
+        for repeat in range(count):
+            time.sleep(toggle_delay)
+            time.sleep(toggle_delay)
+        time.sleep(end_delay)
+        self.lock.release()
+
+def run(name : str, status, seconds : float, readers : int = 4):
+    stop = threading.Event()
+    latencies = [[] for i in range(readers)]
+
+    def reader(latency : list):
+        while not stop.is_set():
+            start = time.perf_counter()
+            status.get_config()
+            status.get_state()
+            status.get_data_count()
+            latency.append(time.perf_counter() - start)
+
+    def writer():
+        while not stop.is_set():
+            status.increment_counter()
+            time.sleep(.001)
+
+    def blinker():
+        while not stop.is_set():
+            status.status_blink(1, .02, .05)
+
+    threads = [threading.Thread(target=reader, args=(latency,)) for latency in latencies]
+    threads += [threading.Thread(target=writer), threading.Thread(target=blinker)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    all = sorted(l for latency in latencies for l in latency)
+    print(f'{name:<9} {len(all) / seconds:10.0f} reads/s   p99 {all[int(len(all) * .99)] * 1e6:9.1f} us'
+          f'   max {all[-1] * 1e3:7.2f} ms   samples counted {status.get_data_count()}')
+
+if __name__ == "__main__":
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3
+    os.chdir(tempfile.mkdtemp())    # Status keeps its spool and energy files in the working directory
+    from status import Status
+    run('locked', LockedStatus(_thread.allocate_lock()), seconds)
+    run('snapshot', Status(_thread.allocate_lock(), state='monitoring'), seconds)
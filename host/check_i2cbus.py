@@ -0,0 +1,95 @@
+# Checks the I2C bus manager against the simulated devices: batched INA219 reads agree with the driver,
+# a batch is never split by display writes from another thread, and per device stats add up.
+#   PYTHONPATH=.:host python3 host/check_i2cbus.py
+import sys
+import threading
+from machine import I2C
+from i2cbus import I2CBus, Batch
+from lib.ina219 import INA219
+
+class SpyI2C(I2C):
+    # records (thread, address) for every transfer, in bus order
+    def __init__(self):
+        super().__init__(1)
+        self.log = []
+
+    def readfrom_mem_into(self, addr, memaddr, buf):
+        self.log.append((threading.get_ident(), addr))
+        super().readfrom_mem_into(addr, memaddr, buf)
+
+    def writevto(self, addr, vector, stop = True):
+        self.log.append((threading.get_ident(), addr))
+        return super().writevto(addr, vector, stop)
+
+def split_batches(log : list, reader : int, size : int) -> int:
+    # batches of size reads by the reader thread with another transfer in the middle
+    split = 0
+    run = 0
+    for thread, addr in log:
+        if thread == reader:
+            run += 1
+        else:
+            if run % size != 0:
+                split += 1
+            run = 0
+    return split
+
+def contend(bus : I2CBus, batch : Batch, read, rounds : int = 2000) -> int:
+    # a thread sending display data while this one reads batches
+    spy = bus.i2c
+    spy.log = []
+    done = threading.Event()
+    display = bus.device(0x3C, 'ssd1306')
+    data = (b'\x40', bytes(16))
+
+    def writer():
+        while not done.is_set():
+            display.writevto(0x3C, data)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    for i in range(rounds):
+        read(batch)
+    done.set()
+    thread.join()
+    return split_batches(spy.log, threading.get_ident(), len(batch.registers))
+
+if __name__ == "__main__":
+    bus = I2CBus(SpyI2C())
+    assert bus.scan() == [0x3C, 0x40]
+    ina = INA219(0.1, bus.device(0x40, 'ina219'))
+    ina.configure(voltage_range=INA219.RANGE_16V, gain=INA219.GAIN_1_40MV)
+    batch = Batch(bus.device(0x40, 'ina219'), (0x02, 0x04, 0x03))
+
+    # one frozen conversion, the batch and the driver read the same registers
+    chip = I2C.devices[0x40]
+    chip._sun = lambda: .8      # whatever the time of day
+    chip._convert()
+    chip.CONVERSION_US = 10 ** 15
+    bus.read(batch)
+    voltage = (batch.unsigned(0) >> 3) * .004
+    current = batch.signed(1) * ina._current_lsb
+    power = batch.unsigned(2) * ina._power_lsb
+    assert abs(voltage - ina.voltage()) < 1e-9
+    assert abs(current * 1000 - ina.current()) < 1e-9
+    assert abs(power * 1000 - ina.power()) < 1e-9
+    print(f'batch {voltage:.3f} V {current * 1000:.1f} mA {power * 1000:.1f} mW matches the driver')
+
+    def unmanaged(batch : Batch):
+        # the same three reads without the bus lock
+        for i in range(len(batch.registers)):
+            bus.i2c.readfrom_mem_into(0x40, batch.registers[i], batch._views[i])
+
+    sys.setswitchinterval(1e-6)     # switch threads often, as if the other core were writing
+    print(f'batches split by display writes: unmanaged {contend(bus, batch, unmanaged)}, bus manager {contend(bus, batch, bus.read)}')
+    assert contend(bus, batch, bus.read) == 0
+
+    try:
+        bus.device(0x41, 'missing').readfrom_mem(0x41, 0, 2)
+        assert False
+    except OSError:
+        pass
+    stats = bus.stats()
+    assert stats['missing']['errors'] == 1 and stats['missing']['transactions'] == 0
+    assert stats['ina219']['transactions'] == stats['batches'] + 5  # configure, calibrate and three driver reads
+    print(stats)
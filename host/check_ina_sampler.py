@@ -0,0 +1,77 @@
+# Triggered INA219 reads against the simulated chip: the chip only converts when triggered, the reads
+# wait for CNVR, power agrees with the bus voltage and current of the same conversion, and hardware
+# averaging brings the noise down.
+#   PYTHONPATH=.:host python3 host/check_ina_sampler.py
+import asyncio
+import statistics
+from machine import I2C
+from i2cbus import I2CBus
+from ina_sampler import INASampler
+from lib.ina219 import INA219
+
+async def run(sampler : INASampler, chip, reads : int) -> list:
+    values = []
+    for i in range(reads):
+        values.append(await sampler.read())
+    return values
+
+if __name__ == "__main__":
+    bus = I2CBus(I2C(1))
+    chip = I2C.devices[0x40]
+    chip._sun = lambda: .8      # whatever the time of day
+    device = bus.device(0x40, 'ina219')
+    ina = INA219(0.1, device)
+    ina.configure(voltage_range=INA219.RANGE_16V, gain=INA219.GAIN_1_40MV)
+    sampler = INASampler(ina, device, averaging=1, diode_drop=0)
+    sampler.start()
+
+    for averaging, reads in ((1, 200), (16, 50), (128, 10)):
+        sampler.configure(averaging)
+        before = chip.conversions
+        transactions = device.transactions
+        values = asyncio.run(run(sampler, chip, reads))
+        assert chip.conversions - before == reads       # one conversion per read, none in between
+        for voltage, current, power in values:
+            # the chip's power register is current times bus voltage from the same conversion
+            assert abs(power - voltage * current) < .002 + power * .002
+        stddev = statistics.pstdev(current for voltage, current, power in values) * 1000
+        stats = sampler.stats()
+        print(f'averaging {averaging:3} conversion {stats["conversion_ms"]:6.2f} ms read {stats["read_ms"]:6.2f} ms '
+              f'current stddev {stddev:.3f} mA, {(device.transactions - transactions) / reads:.1f} transfers per read')
+        assert stats['read_ms'] >= stats['conversion_ms']
+        sampler.reads = sampler._total_us = 0
+    assert sampler.timeouts == 0
+
+    # oversampling at 2 second intervals keeps to the schedule: reads clamped to what fits, on fixed deadlines
+    from aggregate import Window, fill
+    from scheduler import Scheduler
+
+    async def schedule(ticks : int, oversample : int) -> dict:
+        scheduler = Scheduler(2000)
+        window = Window(64)
+        reads = min(oversample, sampler.reads_in(2 * 900))
+        for i in range(ticks):
+            await scheduler.wait()
+            window.reset()
+            await fill(window, sampler.read, reads, 2 * 900)
+        return scheduler.stats()
+
+    sampler.configure(128)
+    stats = asyncio.run(schedule(6, 16))
+    print(f'2 s interval, oversample 16 at averaging 128: {stats}')
+    assert stats['missed'] == 0 and stats['late'] == 0
+
+    # stopping part way through a long fill ends it at the next read or within a second of waiting
+    async def stopped() -> int:
+        window = Window(64)
+        asyncio.get_running_loop().call_later(.5, sampler.stop)
+        await asyncio.wait_for(fill(window, sampler.read, 4, 60000, lambda: sampler.running), 2)
+        return window.count
+
+    print(f'fill stopped after {asyncio.run(stopped())} reads')
+    before = chip.conversions
+    ina.voltage()
+    assert chip.conversions == before   # powered down
+    asyncio.run(sampler.read())
+    assert chip.registers[0] & 0x7 == 0 # a read after stop leaves it powered down
+    print(sampler.stats(), bus.stats())
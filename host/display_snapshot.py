@@ -0,0 +1,74 @@
+# Renders the dashboard for a few samples into PBM images and checks that only changed fields are sent,
+# then pages through it with the button and turns it off and on again.
+#   PYTHONPATH=.:host python3 host/display_snapshot.py [directory, default the system temp directory]
+import sys
+import tempfile
+from ssd1306 import SSD1306_I2C
+from display import Dashboard, write_pbm
+from bench_ssd1306 import FakePanelI2C
+
+SAMPLES = (
+    ({'voltage': 6.12, 'current': .182, 'power': 1.114, 'battery': 87}, 'wifi ok'),
+    ({'voltage': 6.12, 'current': .182, 'power': 1.114, 'battery': 87}, 'wifi ok'),
+    ({'voltage': 6.12, 'current': .184, 'power': 1.114, 'battery': 87}, 'wifi ok'),
+    ({'voltage': 6.08, 'current': .191, 'power': 1.161, 'battery': 86}, 'influx down'),
+)
+
+if __name__ == "__main__":
+    directory = sys.argv[1] if len(sys.argv) > 1 else tempfile.gettempdir()     # not the repo
+    i2c = FakePanelI2C()
+    display = SSD1306_I2C(128, 64, i2c, diff=True)
+    dashboard = Dashboard(display)
+    for index, (readings, link) in enumerate(SAMPLES):
+        regions = display.stats()['regions']
+        sent = i2c.bytes
+        dashboard.update(readings, 'test', link)
+        dashboard.render()
+        assert i2c.ram == display.buffer
+        regions = display.stats()['regions'] - regions
+        path = f'{directory}/dashboard{index}.pbm'
+        write_pbm(display, path)
+        with open(path, 'rb') as f:
+            assert len(f.read()) == len(b'P4\n128 64\n') + 128 * 64 // 8
+        print(f'frame {index} {link:<12} regions {regions} bytes {i2c.bytes - sent} -> {path}')
+        if index == 1:
+            assert regions == 0                 # nothing changed
+        elif index == 2:
+            assert regions == 1                 # only the current field, on page 3
+    print(dashboard.stats(), display.stats())
+
+    # button presses page through the dashboard, the panel goes off when idle and a press wakes it
+    import asyncio
+    from button import Button
+    from display import PAGES
+
+    async def press(button : Button, dashboard : Dashboard):
+        button.pin.value(0)
+        button._last -= button.debounce_ms    # not a bounce of the previous press
+        button.pin._handler(button.pin)
+        assert await button.pressed()
+        button.pin.value(1)
+        dashboard.press()
+
+    async def paging():
+        button = Button(15)
+        dashboard.update_values({'energy_today': 4.21, 'charge_today': 702, 'energy_total': 96.4, 'charge_total': 15870,
+                                 'state': 'monitoring', 'samples': 1234, 'period': 30, 'free_kb': 96.5})
+        for page in range(1, len(PAGES) + 1):
+            await press(button, dashboard)
+            assert dashboard.page == page % len(PAGES)
+            dashboard.render()
+            assert i2c.ram == display.buffer
+            write_pbm(display, f'{directory}/page{dashboard.page}.pbm')
+        assert not dashboard.sleep_if_idle(60)
+        dashboard._active -= 60000
+        assert dashboard.sleep_if_idle(60) and not dashboard.on
+        sent = i2c.bytes
+        dashboard.update(SAMPLES[0][0], 'test', 'wifi ok')
+        assert not dashboard.render() and i2c.bytes == sent     # nothing drawn while off
+        await press(button, dashboard)
+        assert dashboard.on and dashboard.page == 0 and dashboard.render()
+        assert i2c.ram == display.buffer
+        print(dashboard.stats(), button.stats())
+
+    asyncio.run(paging())
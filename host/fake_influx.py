@@ -0,0 +1,60 @@
+# Stand-in for the influxdb v2 write endpoint, used to run the monitor code on a PC.
+#   python3 host/fake_influx.py [port]
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import sys
+import threading
+import zlib
+
+class FakeInflux:
+    def __init__(self, port : int = 8086):
+        self.requests = 0
+        self.lines = 0
+        self.bytes = 0
+        self.compressed = 0     # requests that came in gzipped
+        self.fail = False       # answer 503 to every write to simulate an outage, or a status like 401 to answer that
+        self.received = []      # body of every accepted write
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+        self._server.daemon_threads = True
+        self._server.influx = self
+        self.port = self._server.server_address[1]
+        self.url = f'http://127.0.0.1:{self.port}'
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        influx = self.server.influx
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        influx.requests += 1
+        if self.headers.get('Content-Encoding') == 'gzip':
+            influx.compressed += 1
+            body = zlib.decompress(body, 31)
+        if not self.path.startswith('/api/v2/write') or influx.fail:
+            self.send_response(404 if not influx.fail else 503 if influx.fail is True else influx.fail)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        influx.bytes += len(body)
+        influx.lines += sum(1 for line in body.split(b'\n') if line.strip())
+        influx.received.append(body)
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+if __name__ == "__main__":
+    influx = FakeInflux(int(sys.argv[1]) if len(sys.argv) > 1 else 8086)
+    print('fake influx listening on', influx.url)
+    try:
+        influx._server.serve_forever()
+    except KeyboardInterrupt:
+        print(f'{influx.requests} requests, {influx.lines} lines, {influx.bytes} bytes')
@@ -0,0 +1,124 @@
+# Host stand-in for MicroPython's framebuf module, MONO_VLSB only (the SSD1306 layout: a byte per
+# column of 8 pixel rows, pages of rows one after another). text() draws a made up 8x8 glyph per
+# character (derived from its code, with a blank border) rather than the real font, which is enough
+# to tell characters and redraws apart.
+MONO_VLSB = 0
+MONO_HLSB = 3
+MONO_HMSB = 4
+RGB565 = 1
+GS2_HMSB = 5
+GS4_HMSB = 2
+GS8 = 6
+
+def _glyph(char : str) -> bytes:
+    if char == ' ':
+        return bytes(8)
+    code = ord(char) * 2654435761 & 0xFFFFFFFFFFFF
+    return bytes([0] + [(code >> (8 * i) & 0x7E) | 0x02 for i in range(6)] + [0])
+
+class FrameBuffer:
+    def __init__(self, buffer, width : int, height : int, format : int = MONO_VLSB, stride : int = None):
+        if format != MONO_VLSB:
+            raise ValueError('only MONO_VLSB on the host')
+        self._buffer = buffer
+        self._width = width
+        self._height = height
+
+    def pixel(self, x : int, y : int, c : int = None):
+        if not (0 <= x < self._width and 0 <= y < self._height):
+            return None
+        index = (y >> 3) * self._width + x
+        bit = 1 << (y & 7)
+        if c is None:
+            return 1 if self._buffer[index] & bit else 0
+        if c:
+            self._buffer[index] |= bit
+        else:
+            self._buffer[index] &= ~bit & 0xFF
+
+    def fill(self, c : int):
+        value = 0xFF if c else 0
+        for i in range(len(self._buffer)):
+            self._buffer[i] = value
+
+    def fill_rect(self, x : int, y : int, w : int, h : int, c : int):
+        for yy in range(max(y, 0), min(y + h, self._height)):
+            for xx in range(max(x, 0), min(x + w, self._width)):
+                self.pixel(xx, yy, c)
+
+    def hline(self, x : int, y : int, w : int, c : int):
+        self.fill_rect(x, y, w, 1, c)
+
+    def vline(self, x : int, y : int, h : int, c : int):
+        self.fill_rect(x, y, 1, h, c)
+
+    def rect(self, x : int, y : int, w : int, h : int, c : int, f : bool = False):
+        if f:
+            self.fill_rect(x, y, w, h, c)
+        else:
+            self.hline(x, y, w, c)
+            self.hline(x, y + h - 1, w, c)
+            self.vline(x, y, h, c)
+            self.vline(x + w - 1, y, h, c)
+
+    def line(self, x0 : int, y0 : int, x1 : int, y1 : int, c : int):
+        dx = abs(x1 - x0)
+        dy = -abs(y1 - y0)
+        sx = 1 if x0 < x1 else -1
+        sy = 1 if y0 < y1 else -1
+        error = dx + dy
+        while True:
+            self.pixel(x0, y0, c)
+            if x0 == x1 and y0 == y1:
+                break
+            e2 = 2 * error
+            if e2 >= dy:
+                error += dy
+                x0 += sx
+            if e2 <= dx:
+                error += dx
+                y0 += sy
+
+    # ellipse and poly draw through FrameBuffer.pixel, like the C versions they don't call an override
+    def ellipse(self, x : int, y : int, xr : int, yr : int, c : int, f : bool = False, m : int = 0b1111):
+        for yy in range(-yr, yr + 1):
+            for xx in range(-xr, xr + 1):
+                inside = (xx * xx * yr * yr + yy * yy * xr * xr) <= xr * xr * yr * yr if xr and yr else True
+                if not inside:
+                    continue
+                quadrant = (1 if xx >= 0 and yy <= 0 else 2 if xx < 0 and yy <= 0 else 4 if xx < 0 else 8)
+                if m & quadrant:
+                    FrameBuffer.pixel(self, x + xx, y + yy, c)
+
+    def poly(self, x : int, y : int, coords, c : int, f : bool = False):
+        points = [(x + coords[i], y + coords[i + 1]) for i in range(0, len(coords) - 1, 2)]
+        for i in range(len(points)):
+            (x0, y0), (x1, y1) = points[i], points[(i + 1) % len(points)]
+            steps = max(abs(x1 - x0), abs(y1 - y0), 1)
+            for step in range(steps + 1):
+                FrameBuffer.pixel(self, x0 + (x1 - x0) * step // steps, y0 + (y1 - y0) * step // steps, c)
+
+    def text(self, s : str, x : int, y : int, c : int = 1):
+        for char in s:
+            glyph = _glyph(char)
+            for column in range(8):
+                for row in range(8):
+                    if glyph[column] >> row & 1:
+                        self.pixel(x + column, y + row, c)
+            x += 8
+
+    def scroll(self, xstep : int, ystep : int):
+        pixels = [[self.pixel(x, y) for x in range(self._width)] for y in range(self._height)]
+        for y in range(self._height):
+            for x in range(self._width):
+                sx = x - xstep
+                sy = y - ystep
+                if 0 <= sx < self._width and 0 <= sy < self._height:
+                    self.pixel(x, y, pixels[sy][sx])
+
+    def blit(self, fbuf, x : int, y : int, key : int = -1, palette = None):
+        for yy in range(fbuf._height):
+            for xx in range(fbuf._width):
+                c = fbuf.pixel(xx, yy)
+                if c != key:
+                    self.pixel(x + xx, y + yy, c)
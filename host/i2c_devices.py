@@ -0,0 +1,95 @@
+# Simulated devices for the host machine.I2C, keyed by address in machine.I2C.devices. Each one acts on
+# register reads and writes the way the real part does, so the drivers and the bus manager run unchanged.
+import math
+import random
+import time
+
+class SimulatedINA219:
+    # registers computed the way the datasheet describes, from a clear day solar curve with a little
+    # noise, scaled to the 6V 2W panel and load resistors. Continuously converting, a new conversion is
+    # made at most once per conversion time, so reads close together see the same one. A triggered
+    # conversion is ready (CNVR set) once the conversion time of the ADC settings has passed.
+    # Hardware averaging divides the noise by the square root of the samples averaged.
+    CONVERSION_US = 1064
+    ADC_US = {0: 84, 1: 148, 2: 276, 3: 532, 8: 532, 9: 1060, 10: 2130, 11: 4260, 12: 8510, 13: 17020, 14: 34050, 15: 68100}
+    ADC_SAMPLES = {9: 2, 10: 4, 11: 8, 12: 16, 13: 32, 14: 64, 15: 128}
+
+    def __init__(self, shunt_ohms : float = 0.1):
+        self.shunt_ohms = shunt_ohms
+        self.registers = [0x399F, 0, 0, 0, 0, 0]
+        self.conversions = 0
+        self._converted = 0
+        self._ready = None      # when the triggered conversion finishes
+
+    def _adc(self, shift : int) -> int:
+        return (self.registers[0] >> shift) & 0xF
+
+    def _now(self) -> int:
+        return time.perf_counter_ns() // 1000
+
+    def _sun(self) -> float:
+        # 0 at night, 1 at solar noon
+        t = time.localtime()
+        hour = t[3] + t[4] / 60 + t[5] / 3600
+        return max(0.0, math.sin((hour - 6) / 12 * math.pi))
+
+    def _convert(self):
+        sun = self._sun()
+        noise = 1 / math.sqrt(self.ADC_SAMPLES.get(self._adc(3), 1))
+        volts = 6.2 * min(1.0, sun * 4) + random.uniform(-0.02, 0.02) * noise if sun > 0 else 0.0
+        amps = (.330 * sun + random.uniform(-.002, .002) * noise) if sun > 0 else 0.0
+        shunt = max(-32768, min(32767, round(amps * self.shunt_ohms / 0.00001)))
+        bus = max(0, min(0x1FFF, round(volts / 0.004)))
+        current = shunt * self.registers[5] // 4096
+        power = abs(current) * bus // 5000
+        self.registers[1] = shunt & 0xFFFF
+        self.registers[2] = (bus << 3) | 0x02   # conversion ready
+        self.registers[3] = power & 0xFFFF
+        self.registers[4] = current & 0xFFFF
+        self.conversions += 1
+
+    def read(self, register : int, count : int) -> bytes:
+        mode = self.registers[0] & 0x7
+        now = self._now()
+        if mode == 0x7 and now - self._converted >= self.CONVERSION_US:
+            self._convert()
+            self._converted = now
+        elif self._ready is not None and now >= self._ready:
+            self._convert()
+            self._ready = None
+        value = self.registers[register]
+        if register == 3:
+            self.registers[2] &= ~0x02  # reading power clears conversion ready
+        return bytes(((value >> 8) & 0xFF, value & 0xFF))[:count]
+
+    def write(self, register : int, data : bytes):
+        if register == 0 and data[0] & 0x80:
+            self.registers = [0x399F, 0, 0, 0, 0, 0]    # reset bit
+            return
+        self.registers[register] = (data[0] << 8) | data[1]
+        if register == 0:
+            self._ready = None
+            mode = data[1] & 0x7
+            if 0 < mode < 4:
+                # triggered, shunt and/or bus converted one after the other
+                self.registers[2] &= ~0x02
+                self._ready = self._now() + (self.ADC_US[self._adc(3)] if mode & 1 else 0) + (self.ADC_US[self._adc(7)] if mode & 2 else 0)
+
+class SimulatedSSD1306:
+    # takes the command and data writes, counts them
+    def __init__(self):
+        self.writes = 0
+        self.bytes = 0
+
+    def read(self, register : int, count : int) -> bytes:
+        return bytes(count)
+
+    def write(self, register : int, data : bytes):
+        self.writeto(bytes((register,)) + data)
+
+    def writeto(self, data : bytes):
+        self.writes += 1
+        self.bytes += len(data)
+
+def default_devices() -> dict:
+    return {0x3C: SimulatedSSD1306(), 0x40: SimulatedINA219()}
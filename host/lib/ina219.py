@@ -0,0 +1,164 @@
+# Host stand-in for the INA219 driver (lib/ina219.py on the Pico, pyb_ina219). Talks to the chip's
+# registers over the I2C object it is given the same way the real driver does, with the same
+# calibration and LSB attributes, just without auto gain and logging. On the host the chip is the
+# simulated one in i2c_devices.
+import math
+import struct
+import time
+
+class INA219:
+    RANGE_16V = 0
+    RANGE_32V = 1
+    GAIN_1_40MV = 0
+    GAIN_2_80MV = 1
+    GAIN_4_160MV = 2
+    GAIN_8_320MV = 3
+    GAIN_AUTO = -1
+    ADC_9BIT = 0
+    ADC_10BIT = 1
+    ADC_11BIT = 2
+    ADC_12BIT = 3
+    ADC_2SAMP = 9
+    ADC_4SAMP = 10
+    ADC_8SAMP = 11
+    ADC_16SAMP = 12
+    ADC_32SAMP = 13
+    ADC_64SAMP = 14
+    ADC_128SAMP = 15
+
+    __REG_CONFIG = 0x00
+    __REG_SHUNTVOLTAGE = 0x01
+    __REG_BUSVOLTAGE = 0x02
+    __REG_POWER = 0x03
+    __REG_CURRENT = 0x04
+    __REG_CALIBRATION = 0x05
+
+    __RST = 15
+    __BRNG = 13
+    __PG1 = 12
+    __PG0 = 11
+    __BADC4 = 10
+    __BADC1 = 7
+    __SADC4 = 6
+    __SADC1 = 3
+    __MODE3 = 2
+    __MODE1 = 0
+
+    __OVF = 1
+    __CNVR = 2
+
+    __BUS_RANGE = [16, 32]
+    __GAIN_VOLTS = [0.04, 0.08, 0.16, 0.32]
+
+    __CONT_SH_BUS = 7
+
+    __SHUNT_MILLIVOLTS_LSB = 0.01   # 10uV
+    __BUS_MILLIVOLTS_LSB = 4        # 4mV
+    __CALIBRATION_FACTOR = 0.04096
+    __MAX_CALIBRATION_VALUE = 0xFFFE
+    __CURRENT_LSB_FACTOR = 32800
+
+    def __init__(self, shunt_ohms, i2c, max_expected_amps = None, address = 0x40, log_level = None):
+        self._i2c = i2c
+        self._address = address
+        self._shunt_ohms = shunt_ohms
+        self._max_expected_amps = max_expected_amps
+        self._min_device_current_lsb = self._calculate_min_current_lsb()
+        self._gain = None
+        self._auto_gain_enabled = False
+
+    def configure(self, voltage_range = RANGE_32V, gain = GAIN_AUTO, bus_adc = ADC_12BIT, shunt_adc = ADC_12BIT):
+        self._voltage_range = voltage_range
+        self._gain = self.GAIN_8_320MV if gain == self.GAIN_AUTO else gain
+        self._auto_gain_enabled = gain == self.GAIN_AUTO
+        self._calibrate(self.__BUS_RANGE[voltage_range], self.__GAIN_VOLTS[self._gain], self._max_expected_amps)
+        self._configuration_register((voltage_range << self.__BRNG | self._gain << self.__PG0 |
+                                      bus_adc << self.__BADC1 | shunt_adc << self.__SADC1 | self.__CONT_SH_BUS))
+
+    def voltage(self) -> float:
+        value = self._voltage_register()
+        return float(value) * self.__BUS_MILLIVOLTS_LSB / 1000
+
+    def supply_voltage(self) -> float:
+        return self.voltage() + (float(self.shunt_voltage()) / 1000)
+
+    def current(self) -> float:
+        # milliamps
+        return self._current_register() * self._current_lsb * 1000
+
+    def power(self) -> float:
+        # milliwatts
+        return self._power_register() * self._power_lsb * 1000
+
+    def shunt_voltage(self) -> float:
+        # millivolts
+        return self._shunt_voltage_register() * self.__SHUNT_MILLIVOLTS_LSB
+
+    def sleep(self):
+        configuration = self._read_configuration()
+        self._configuration_register(configuration & 0xFFF8)
+
+    def wake(self):
+        configuration = self._read_configuration()
+        self._configuration_register(configuration | 0x0007)
+        time.sleep(0.00004)   # 40us to power up
+
+    def current_overflow(self) -> bool:
+        return self._has_current_overflow()
+
+    def reset(self):
+        self._configuration_register(1 << self.__RST)
+
+    def _calibrate(self, bus_volts_max, shunt_volts_max, max_expected_amps = None):
+        max_possible_amps = shunt_volts_max / self._shunt_ohms
+        self._current_lsb = self._determine_current_lsb(max_expected_amps, max_possible_amps)
+        self._power_lsb = self._current_lsb * 20
+        calibration = math.trunc(self.__CALIBRATION_FACTOR / (self._current_lsb * self._shunt_ohms))
+        self._calibration_register(calibration)
+
+    def _determine_current_lsb(self, max_expected_amps, max_possible_amps) -> float:
+        if max_expected_amps is not None:
+            current_lsb = max(max_expected_amps / self.__CURRENT_LSB_FACTOR, self._min_device_current_lsb)
+        else:
+            current_lsb = max_possible_amps / self.__CURRENT_LSB_FACTOR
+        return current_lsb
+
+    def _calculate_min_current_lsb(self) -> float:
+        return self.__CALIBRATION_FACTOR / (self._shunt_ohms * self.__MAX_CALIBRATION_VALUE)
+
+    def _has_current_overflow(self) -> bool:
+        ovf = self._read_voltage_register() & self.__OVF
+        return ovf == 1
+
+    def _configuration_register(self, register_value):
+        self._write_register(self.__REG_CONFIG, register_value)
+
+    def _read_configuration(self) -> int:
+        return self._read_register(self.__REG_CONFIG)
+
+    def _calibration_register(self, register_value):
+        self._write_register(self.__REG_CALIBRATION, register_value)
+
+    def _read_voltage_register(self) -> int:
+        return self._read_register(self.__REG_BUSVOLTAGE)
+
+    def _voltage_register(self) -> int:
+        return self._read_voltage_register() >> 3
+
+    def _current_register(self) -> int:
+        return self._read_register(self.__REG_CURRENT, True)
+
+    def _shunt_voltage_register(self) -> int:
+        return self._read_register(self.__REG_SHUNTVOLTAGE, True)
+
+    def _power_register(self) -> int:
+        return self._read_register(self.__REG_POWER)
+
+    def _write_register(self, register, register_value):
+        self._i2c.writeto_mem(self._address, register, bytearray([(register_value >> 8) & 0xFF, register_value & 0xFF]))
+
+    def _read_register(self, register, negative_value_supported = False) -> int:
+        register_bytes = self._i2c.readfrom_mem(self._address, register, 2)
+        if negative_value_supported:
+            return struct.unpack('>h', register_bytes)[0]
+        return struct.unpack('>H', register_bytes)[0]
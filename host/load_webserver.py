@@ -0,0 +1,70 @@
+# Web server load test over local sockets: concurrent clients sending status requests, while a few
+# stalled clients hold connections open without finishing their request.
+#   PYTHONPATH=.:host python3 host/load_webserver.py [clients] [requests per client] [stalled]
+import asyncio
+import io
+import socket
+import sys
+import time
+from contextlib import redirect_stdout
+from server import WebServer
+
+def free_port() -> int:
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+async def client(port : int, count : int, latencies : list, errors : list):
+    # a large request, split over several writes so it can't arrive in one read
+    padding = 'X-Padding: ' + 'x' * 900 + '\r\n'
+    for i in range(count):
+        start = time.perf_counter()
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b'GET /status?n=%d HTTP/1.1\r\nHost: pico\r\n' % i)
+            await writer.drain()
+            writer.write(padding.encode() + b'\r\n')
+            response = await reader.read()
+            writer.close()
+            if not (response.startswith(b'HTTP/1.0 200') or response.startswith(b'HTTP/1.0 303')):
+                errors.append(response.split(b'\r\n')[0])
+        except OSError as e:
+            errors.append(str(e))
+        latencies.append((time.perf_counter() - start) * 1000)
+
+async def stalled(port : int, seconds : float):
+    # sends half a request line and goes quiet, like a browser's speculative connection
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(b'GET /sta')
+    await writer.drain()
+    await asyncio.sleep(seconds)
+    writer.close()
+
+async def main(clients : int, count : int, stalls : int):
+    port = free_port()
+    handled = []
+    server = WebServer(None, port, max_clients=clients + stalls, timeout=2)
+    with redirect_stdout(io.StringIO()):
+        await server.start(lambda request, status : handled.append(request.command))
+        stuck = [asyncio.create_task(stalled(port, 3)) for i in range(stalls)]
+        await asyncio.sleep(.1)
+        latencies = []
+        errors = []
+        start = time.perf_counter()
+        await asyncio.gather(*[client(port, count, latencies, errors) for i in range(clients)])
+        elapsed = time.perf_counter() - start
+        await asyncio.gather(*stuck)
+        server.shutdown()
+    latencies.sort()
+    total = len(latencies)
+    print(f'{clients} clients x {count} requests, {stalls} stalled connections')
+    print(f'{total / elapsed:.0f} req/s   p50 {latencies[total // 2]:.2f} ms   p99 {latencies[int(total * .99)]:.2f} ms   max {latencies[-1]:.2f} ms')
+    print(f'handled {len(handled)}, errors {len(errors)} {errors[:3]}, server {server.stats()}')
+
+if __name__ == "__main__":
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 250
+    stalls = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+    asyncio.run(main(clients, count, stalls))
@@ -0,0 +1,117 @@
+# Host stand-in for the MicroPython machine module, just enough to run the monitor with CPython.
+import time
+
+class Pin:
+    IN = 0
+    OUT = 1
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    def __init__(self, id, mode = -1, pull = -1, value = None):
+        self.id = id
+        if value is None:
+            value = 1 if pull == Pin.PULL_UP else 0
+        self._value = value
+        self._handler = None
+
+    def init(self, mode = -1, pull = -1, value = None):
+        if value is not None:
+            self._value = value
+
+    def on(self):
+        self._value = 1
+
+    def off(self):
+        self._value = 0
+
+    def value(self, value = None):
+        if value is None:
+            return self._value
+        self._value = value
+
+    def __call__(self, value = None):
+        return self.value(value)
+
+    def irq(self, handler = None, trigger = 0):
+        self._handler = handler
+
+class ADC:
+    # plausible raw readings: die temperature ~25C, vsys ~4.0V through the 3.75 divider, ground
+    _RAW = {1: 200, 2: 21400, 3: 26500, 4: 14200}
+
+    def __init__(self, channel):
+        self.channel = channel
+
+    def read_u16(self) -> int:
+        return self._RAW.get(self.channel, 0)
+
+class I2C:
+    # the simulated devices on the bus, by address, see i2c_devices. Shared by every I2C instance
+    # like the wires are, a script can replace or add devices before the monitor starts
+    devices = None
+
+    def __init__(self, id, sda = None, scl = None, freq = 400000):
+        self.id = id
+        self.freq = freq
+        if I2C.devices is None:
+            from i2c_devices import default_devices
+            I2C.devices = default_devices()
+
+    def _device(self, addr):
+        device = self.devices.get(addr)
+        if device is None:
+            raise OSError(19)   # ENODEV, what the Pico raises when nothing acks the address
+        return device
+
+    def scan(self) -> list:
+        return sorted(self.devices)
+
+    def readfrom_mem(self, addr, memaddr, nbytes):
+        return self._device(addr).read(memaddr, nbytes)
+
+    def readfrom_mem_into(self, addr, memaddr, buf):
+        buf[:] = self._device(addr).read(memaddr, len(buf))
+
+    def writeto_mem(self, addr, memaddr, buf):
+        self._device(addr).write(memaddr, bytes(buf))
+
+    def writeto(self, addr, buf, stop = True):
+        self._device(addr).writeto(bytes(buf))
+        return len(buf)
+
+    def writevto(self, addr, vector, stop = True):
+        self._device(addr).writeto(b''.join(bytes(buf) for buf in vector))
+        return sum(len(buf) for buf in vector)
+
+class Timer:
+    PERIODIC = 1
+    ONE_SHOT = 0
+
+    def __init__(self, id = -1):
+        pass
+
+    def init(self, mode = PERIODIC, period = -1, callback = None):
+        pass
+
+    def deinit(self):
+        pass
+
+class RTC:
+    def datetime(self, datetime = None):
+        if datetime is None:
+            t = time.localtime()
+            return (t[0], t[1], t[2], t[6], t[3], t[4], t[5], 0)
+
+class _Mem:
+    def __init__(self):
+        self._words = {}
+
+    def __getitem__(self, address):
+        return self._words.get(address, 0)
+
+    def __setitem__(self, address, value):
+        self._words[address] = value
+
+mem32 = _Mem()
@@ -0,0 +1,9 @@
+# Host stand-in for the MicroPython micropython module.
+def const(value):
+    return value
+
+def schedule(function, argument):
+    function(argument)
+
+def alloc_emergency_exception_buf(size):
+    pass
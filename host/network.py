@@ -0,0 +1,27 @@
+# Host stand-in for the MicroPython network module, the "wlan" is always connected.
+STA_IF = 0
+AP_IF = 1
+
+class WLAN:
+    def __init__(self, interface = STA_IF):
+        self._active = False
+
+    def active(self, active = None):
+        if active is None:
+            return self._active
+        self._active = active
+
+    def connect(self, ssid, password):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def isconnected(self) -> bool:
+        return True
+
+    def status(self, param = None):
+        return 3    # CYW43_LINK_UP
+
+    def ifconfig(self):
+        return ('127.0.0.1', '255.0.0.0', '127.0.0.1', '127.0.0.1')
@@ -0,0 +1,67 @@
+# Packages the web page for the Pico's flash: the Bootstrap CDN css is replaced by the few rules the
+# page actually uses (inlined, so the page works with no internet access), the unused Bootstrap js is
+# dropped, indentation is stripped, and a gzip copy is written next to each file that compresses.
+# Copy everything in the output directory to the Pico, StaticFiles sends the .gz copy to browsers that accept it.
+#   python3 host/package_site.py [output directory, default site]
+import gzip
+import os
+import re
+import sys
+
+# the subset of bootstrap 5 used by index.html
+CSS = """
+*,::after,::before{box-sizing:border-box}
+body{margin:0;font-family:system-ui,-apple-system,"Segoe UI",Roboto,Arial,sans-serif;font-size:1rem;line-height:1.5;color:#212529}
+table{border-collapse:collapse}
+.table{margin-bottom:1rem}
+.container{width:100%;padding:0 .75rem;margin:0 auto}
+.row{display:flex;flex-wrap:wrap}
+.col-6{flex:0 0 auto;width:50%}
+.col-12{flex:0 0 auto;width:100%}
+.text-center{text-align:center}
+.text-right{text-align:right}
+.justify-content-md-center{justify-content:center}
+.p-1{padding:.25rem}
+.p-2{padding:.5rem}
+.bg-light{background-color:#f8f9fa}
+.border{border:1px solid #dee2e6}
+.form-group{margin-bottom:.5rem}
+label{display:inline-block}
+.form-control{display:block;width:100%;padding:.375rem .75rem;font-size:1rem;border:1px solid #ced4da;border-radius:.375rem}
+.btn-group{display:inline-flex;gap:.25rem}
+.btn{display:inline-block;padding:.375rem .75rem;font-size:1rem;color:#fff;border:1px solid transparent;border-radius:.375rem;cursor:pointer}
+.btn-primary{background-color:#0d6efd}
+.btn-success{background-color:#198754}
+.btn-danger{background-color:#dc3545}
+.btn.disabled{opacity:.65;pointer-events:none}
+"""
+
+def package(source : str, output : str):
+    with open(os.path.join(source, 'index.html')) as f:
+        html = f.read()
+    html = re.sub(r'<link href="https://cdn\.jsdelivr\.net/[^>]*bootstrap[^>]*>',
+                  '<style>' + ''.join(line.strip() for line in CSS.splitlines()) + '</style>', html)
+    html = re.sub(r'\s*<script src="https://cdn\.jsdelivr\.net/[^>]*bootstrap[^>]*></script>', '', html)
+    html = '\n'.join(line.strip() for line in html.splitlines() if line.strip())
+    assert 'cdn.jsdelivr.net' not in html, 'page still refers to the CDN'
+
+    os.makedirs(output, exist_ok=True)
+    files = {'index.html': html.encode()}
+    with open(os.path.join(source, 'favicon.png'), 'rb') as f:
+        files['favicon.png'] = f.read()
+    for name, data in files.items():
+        with open(os.path.join(output, name), 'wb') as f:
+            f.write(data)
+        compressed = gzip.compress(data, 9, mtime=0)
+        path = os.path.join(output, name + '.gz')
+        if len(compressed) < len(data) * .9:
+            with open(path, 'wb') as f:
+                f.write(compressed)
+            print(f'{name:<12} {len(data):6} bytes, gzip {len(compressed):6}')
+        else:
+            if os.path.exists(path):
+                os.remove(path)
+            print(f'{name:<12} {len(data):6} bytes, not worth compressing')
+
+if __name__ == "__main__":
+    package(os.path.join(os.path.dirname(__file__), '..'), sys.argv[1] if len(sys.argv) > 1 else 'site')
@@ -0,0 +1,69 @@
+# Replays a day of samples through the deadband filter and reports how many points (and line protocol
+# bytes) are written compared with uploading every sample.
+#   PYTHONPATH=.:host python3 host/replay_deadband.py [readings.csv] [delay]
+# The csv has a header row of reading names (voltage,current,power,...), one sample per row. Without
+# one a clear day is synthesised: night zeros, a noisy solar curve, slowly rising temperature and battery.
+import csv
+import math
+import random
+import sys
+from deadband import Deadband
+from influxdb_api_client import LineEncoder
+from main import build_points, changed_readings
+
+def synthetic_day(delay : int) -> list[dict]:
+    random.seed(1)
+    samples = []
+    energy = charge = 0.0
+    for i in range(86400 // delay):
+        hour = i * delay / 3600
+        sun = max(0.0, math.sin((hour - 6) / 12 * math.pi))
+        if sun > 0:
+            voltage = 6.2 * min(1.0, sun * 4) + random.uniform(-.02, .02) + .8
+            current = (330 * sun + random.uniform(-2, 2)) / 1000
+        else:
+            voltage = current = 0.0
+        power = voltage * current
+        energy += power * delay / 3600
+        charge += current * delay / 3.6
+        samples.append({'voltage': voltage, 'current': current, 'power': power,
+                        'temperature': 70 + 15 * sun + random.uniform(-.3, .3),
+                        'vsys': 3.7 + .4 * min(1.0, energy / 4) + random.uniform(-.01, .01),
+                        'battery': round(58 + 33 * min(1.0, energy / 4)),
+                        'freemem': 120000 - random.randrange(0, 3) * 2048,
+                        'energy_today': energy, 'charge_today': charge, 'energy_total': 100 + energy, 'charge_total': 20000 + charge})
+    return samples
+
+def load_csv(path : str) -> list[dict]:
+    with open(path) as f:
+        return [{name: float(value) for name, value in row.items()} for row in csv.DictReader(f)]
+
+def replay(samples : list[dict], deadband : Deadband, layout : str, delay : int) -> tuple[int, int, int]:
+    # returns points, fields and encoded bytes written
+    encoder = LineEncoder(4096)
+    points = fields = size = 0
+    for i, readings in enumerate(samples):
+        if deadband is not None:
+            readings, spread = changed_readings(deadband, readings, None)
+        if len(readings) == 0:
+            continue
+        for point in build_points(readings, None, 'replay', 1700000000000 + i * delay * 1000, layout):
+            encoder.reset()
+            encoder.encode(point)
+            points += 1
+            fields += len(point.fields) if point.fields is not None else 1
+            size += encoder.length
+    return points, fields, size
+
+if __name__ == "__main__":
+    delay = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    samples = load_csv(sys.argv[1]) if len(sys.argv) > 1 else synthetic_day(delay)
+    print(f'{len(samples)} samples, delay {delay}s')
+    for layout in ('legacy', 'fields'):
+        base_points, base_fields, base_size = replay(samples, None, layout, delay)
+        print(f'{layout:<7} every sample      {base_points:6} points {base_fields:6} fields {base_size:8} bytes')
+        for heartbeat in (10, 30, 120):
+            deadband = Deadband(heartbeat=heartbeat)
+            points, fields, size = replay(samples, deadband, layout, delay)
+            print(f'{layout:<7} heartbeat {heartbeat:<4}    {points:6} points {fields:6} fields {size:8} bytes'
+                  f'   -{100 - 100 * points / base_points:.0f}% points -{100 - 100 * size / base_size:.0f}% bytes')
@@ -0,0 +1,12 @@
+# Host settings, the influx url points at host/fake_influx.py
+wifi = {
+    'ssid' : 'host',
+    'password' : 'host',
+}
+
+influxdb = {
+    'url': 'http://127.0.0.1:8086',
+    'organization': 'host',
+    'bucket': 'solar',
+    'token': 'host'
+}
@@ -0,0 +1,21 @@
+# Loaded automatically by CPython when host/ is on PYTHONPATH, fills in MicroPython only builtins.
+import gc
+import os
+import sys
+import traceback
+
+if not hasattr(sys, 'print_exception'):
+    def print_exception(e, file=sys.stderr):
+        traceback.print_exception(type(e), e, e.__traceback__, file=file)
+    sys.print_exception = print_exception
+
+if not hasattr(gc, 'mem_free'):
+    gc.mem_free = lambda: 150000
+    gc.mem_alloc = lambda: 50000
+
+# the repo's logging.py is the MicroPython one, CPython's own modules (asyncio) need the standard library
+# version, so load that first. It has the same level constants, so the monitor code works with it too.
+_path = sys.path
+sys.path = [p for p in sys.path if not os.path.isfile(os.path.join(p or '.', 'logging.py'))]
+import logging
+sys.path = _path
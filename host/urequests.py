@@ -0,0 +1,35 @@
+# Host stand-in for micropython-lib urequests, only what influxdb_api_client uses.
+# Like urequests every request opens (and closes) its own connection.
+import http.client
+from urllib.parse import urlsplit
+
+class Response:
+    def __init__(self, status_code : int, reason : str, content : bytes):
+        self.status_code = status_code
+        self.reason = reason
+        self.content = content
+
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8')
+
+    def close(self):
+        pass
+
+def post(url : str, data = None, headers : dict = {}):
+    parts = urlsplit(url)
+    if parts.scheme == 'https':
+        connection = http.client.HTTPSConnection(parts.hostname, parts.port or 443)
+    else:
+        connection = http.client.HTTPConnection(parts.hostname, parts.port or 80)
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    elif isinstance(data, memoryview):
+        data = bytes(data)
+    try:
+        path = parts.path + ('?' + parts.query if parts.query else '')
+        connection.request('POST', path, body=data, headers=headers)
+        response = connection.getresponse()
+        return Response(response.status, response.reason, response.read())
+    finally:
+        connection.close()
@@ -0,0 +1,2 @@
+# Host stand-in for MicroPython's utime (ntptime imports it by that name).
+from time import *
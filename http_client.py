@@ -0,0 +1,148 @@
+import asyncio
+
+# Minimal asyncio HTTP/1.1 client that keeps one connection open between requests.
+#
+# urequests opens a new socket (and for https does a new TLS handshake) for every request, and blocks
+# while it waits. This client connects once and reuses the connection while the server allows it, and
+# yields to the other tasks while the network is slow. A request on a reused connection that fails
+# (the server dropped an idle connection) is retried once on a fresh connection.
+# Every response is read to the end so the next request starts on a clean stream, the start of the
+# body is kept in a fixed buffer for error messages, the rest is discarded.
+# There is one connection, so requests from different tasks (a flush and a background spool drain) take
+# turns, one request's bytes mixed into another's would break both.
+class HttpClient:
+    def __init__(self, url : str, timeout : float = 10, keepalive : bool = True, body_size : int = 256):
+        scheme, _, host = url.split('/', 3)[:3]
+        self.https = scheme == 'https:'
+        if ':' in host:
+            host, port = host.split(':')
+            self.port = int(port)
+        else:
+            self.port = 443 if self.https else 80
+        self.host = host
+        self.timeout = timeout
+        self.keepalive = keepalive
+        self.connects = 0
+        self.requests = 0
+        self.status = 0
+        self.reason = ''
+        self.body = b''
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+        self._buffer = bytearray(body_size)
+        self._view = memoryview(self._buffer)
+        self._host_header = f'Host: {host}\r\n'.encode()
+
+    async def _connect(self):
+        if self.https:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port, ssl=True)
+        else:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        self.connects += 1
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = None
+        self._writer = None
+
+    async def request(self, method : str, path : str, headers : bytes = b'', body = b'') -> int:
+        # headers is a block of "Name: value\r\n" lines, returns the response status
+        async with self._lock:
+            reused = self._writer is not None
+            for attempt in range(2):
+                try:
+                    await asyncio.wait_for(self._exchange(method, path, headers, body), self.timeout)
+                    break
+                except (OSError, asyncio.TimeoutError, EOFError):
+                    self.close()
+                    if not reused or attempt == 1:
+                        raise
+                    reused = False
+                except:
+                    self.close()
+                    raise
+            self.requests += 1
+            return self.status
+
+    async def post(self, path : str, headers : bytes, body) -> int:
+        return await self.request('POST', path, headers, body)
+
+    async def _exchange(self, method : str, path : str, headers : bytes, body):
+        if self._writer is None:
+            await self._connect()
+        await self._send(method, path, headers, body)
+        await self._receive()
+
+    async def _send(self, method : str, path : str, headers : bytes, body):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        writer = self._writer
+        writer.write(f'{method} {path} HTTP/1.1\r\n'.encode())
+        writer.write(self._host_header)
+        writer.write(headers)
+        if not self.keepalive:
+            writer.write(b'Connection: close\r\n')
+        writer.write(f'Content-Length: {len(body)}\r\n\r\n'.encode())
+        if len(body) > 0:
+            writer.write(body)
+        await writer.drain()
+
+    async def _receive(self):
+        reader = self._reader
+        line = await reader.readline()
+        if not line:
+            raise EOFError('connection closed')
+        parts = line.split(None, 2)
+        self.status = int(parts[1])
+        self.reason = parts[2].rstrip().decode() if len(parts) > 2 else ''
+        length = -1
+        chunked = False
+        close = not self.keepalive
+        while True:
+            line = await reader.readline()
+            if not line or line == b'\r\n':
+                break
+            name, _, value = line.partition(b':')
+            name = name.strip().lower()
+            if name == b'content-length':
+                length = int(value)
+            elif name == b'transfer-encoding':
+                chunked = b'chunked' in value.lower()
+            elif name == b'connection':
+                close = close or b'close' in value.lower()
+
+        kept = 0
+        if chunked:
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    await reader.readline()     # trailing blank line
+                    break
+                kept = await self._drain(size, kept)
+                await reader.readline()         # chunk terminator
+        elif length >= 0:
+            kept = await self._drain(length, kept)
+        elif self.status not in (204, 304):
+            kept = await self._drain(-1, kept)  # no length, body ends when the server closes
+            close = True
+        self.body = self._view[:kept]
+        if close:
+            self.close()
+
+    async def _drain(self, length : int, kept : int) -> int:
+        # read length bytes (or to end of stream when -1), keeping what fits in the body buffer
+        while length != 0:
+            data = await self._reader.read(min(length, 256) if length > 0 else 256)
+            if not data:
+                if length > 0:
+                    raise EOFError('connection closed')
+                break
+            count = min(len(data), len(self._buffer) - kept)
+            if count > 0:
+                self._view[kept:kept + count] = data[:count]
+                kept += count
+            if length > 0:
+                length -= len(data)
+        return kept
@@ -0,0 +1,139 @@
+import _thread
+from clock import ticks_us, ticks_diff
+
+# One owner for the I2C bus the INA219 and the SSD1306 share.
+#
+# Drivers get a Device from device(), which has the I2C methods they use (readfrom_mem, writeto,
+# writevto...) with the address already bound, so the drivers don't change. Every transfer goes through
+# the bus lock and is counted and timed against its device. The asyncio tasks all run on one thread so
+# their transfers can't overlap anyway, the lock is for anything on the other core, and to keep a
+# Batch in one piece.
+# A Batch is a fixed list of registers read back to back under one lock into a preallocated buffer,
+# e.g. the INA219 bus voltage, current and power, so the values come from the same moment (no display
+# update between them) and the read allocates nothing.
+class Device:
+    def __init__(self, bus, address : int, name : str):
+        self.bus = bus
+        self.address = address
+        self.name = name
+        self.transactions = 0
+        self.errors = 0
+        self.bytes = 0
+        self.total_us = 0
+        self.max_us = 0
+
+    def _record(self, start : int, count : int):
+        elapsed = ticks_diff(ticks_us(), start)
+        self.transactions += 1
+        self.bytes += count
+        self.total_us += elapsed
+        if elapsed > self.max_us:
+            self.max_us = elapsed
+
+    # the machine.I2C methods the drivers use, the address argument is ignored
+    def readfrom_mem(self, addr : int, memaddr : int, nbytes : int) -> bytes:
+        buf = bytearray(nbytes)
+        self.readfrom_mem_into(addr, memaddr, buf)
+        return bytes(buf)
+
+    def readfrom_mem_into(self, addr : int, memaddr : int, buf):
+        self.bus.transfer(self, self.bus.i2c.readfrom_mem_into, memaddr, buf, len(buf))
+
+    def writeto_mem(self, addr : int, memaddr : int, buf):
+        self.bus.transfer(self, self.bus.i2c.writeto_mem, memaddr, buf, len(buf))
+
+    def writeto(self, addr : int, buf, stop : bool = True):
+        self.bus.transfer(self, self.bus.i2c.writeto, buf, None, len(buf))
+
+    def writevto(self, addr : int, vector, stop : bool = True):
+        count = 0
+        for buf in vector:
+            count += len(buf)
+        self.bus.transfer(self, self.bus.i2c.writevto, vector, None, count)
+
+    def stats(self) -> dict:
+        return {
+            'transactions': self.transactions,
+            'errors': self.errors,
+            'bytes': self.bytes,
+            'mean_us': self.total_us // self.transactions if self.transactions > 0 else 0,
+            'max_us': self.max_us,
+        }
+
+class Batch:
+    def __init__(self, device : Device, registers : tuple, width : int = 2):
+        self.device = device
+        self.registers = registers
+        self.width = width
+        self.buffer = bytearray(width * len(registers))
+        view = memoryview(self.buffer)
+        self._views = [view[i * width:(i + 1) * width] for i in range(len(registers))]
+
+    def unsigned(self, index : int) -> int:
+        # register index of the batch, big endian like the INA219's
+        offset = index * self.width
+        return (self.buffer[offset] << 8) | self.buffer[offset + 1]
+
+    def signed(self, index : int) -> int:
+        value = self.unsigned(index)
+        return value - 0x10000 if value & 0x8000 else value
+
+class I2CBus:
+    def __init__(self, i2c):
+        self.i2c = i2c
+        self.lock = _thread.allocate_lock()
+        self.devices = {}
+        self.batches = 0
+
+    def scan(self) -> list:
+        self.lock.acquire()
+        try:
+            return self.i2c.scan()
+        finally:
+            self.lock.release()
+
+    def device(self, address : int, name : str) -> Device:
+        device = self.devices.get(address)
+        if device is None:
+            device = Device(self, address, name)
+            self.devices[address] = device
+        return device
+
+    def transfer(self, device : Device, method, first, second, count : int):
+        # one transfer under the lock, method(address, first[, second])
+        self.lock.acquire()
+        start = ticks_us()
+        try:
+            if second is None:
+                method(device.address, first)
+            else:
+                method(device.address, first, second)
+            device._record(start, count)
+        except OSError:
+            device.errors += 1
+            raise
+        finally:
+            self.lock.release()
+
+    def read(self, batch : Batch):
+        # reads every register of the batch into batch.buffer, as one transaction
+        device = batch.device
+        readfrom_mem_into = self.i2c.readfrom_mem_into
+        self.lock.acquire()
+        start = ticks_us()
+        try:
+            for i in range(len(batch.registers)):
+                readfrom_mem_into(device.address, batch.registers[i], batch._views[i])
+            device._record(start, len(batch.buffer))
+            self.batches += 1
+        except OSError:
+            device.errors += 1
+            raise
+        finally:
+            self.lock.release()
+
+    def stats(self) -> dict:
+        stats = {'batches': self.batches}
+        for device in self.devices.values():
+            stats[device.name] = device.stats()
+        return stats
@@ -0,0 +1,118 @@
+import asyncio
+from clock import ticks_us, ticks_diff
+from i2cbus import Batch
+
+# INA219 readings from triggered conversions, on top of the lib.ina219 driver (which does the
+# calibration, the range and the gain).
+#
+# The driver leaves the chip converting continuously at 12 bits with no averaging. Here the shunt and bus
+# ADCs average up to 128 conversions in hardware, and the chip only converts when a reading is wanted:
+# writing the configuration with the triggered mode starts one conversion, then the chip is idle until
+# the next one. Instead of a fixed wait, the conversion ready bit (CNVR) of the bus voltage register is
+# polled, a few times over the expected conversion time. Once it is set the bus voltage, current and
+# power registers are read as one bus batch, so the three values come from that one conversion, and power
+# comes from the chip's own power register rather than voltage times current from different moments.
+# Reading the power register, or the next trigger, clears CNVR.
+REG_CONFIG = 0x00
+REG_BUS = 0x02
+REG_POWER = 0x03
+REG_CURRENT = 0x04
+CNVR = 0x02
+OVF = 0x01
+MODE_POWER_DOWN = 0x0
+MODE_TRIGGERED = 0x3        # shunt and bus, one conversion per trigger
+RANGE_GAIN = 0x3800         # BRNG and PG bits, kept as the driver configured them
+AVERAGING = {1: 3, 2: 9, 4: 10, 8: 11, 16: 12, 32: 13, 64: 14, 128: 15}    # samples: ADC setting
+CONVERSION_US = {3: 532, 9: 1060, 10: 2130, 11: 4260, 12: 8510, 13: 17020, 14: 34050, 15: 68100}
+
+class INASampler:
+    def __init__(self, ina, device, averaging : int = 128, diode_drop : float = .8, polls : int = 8):
+        self.ina = ina
+        self.device = device
+        self.diode_drop = diode_drop
+        self.polls = polls              # CNVR reads spread over the expected conversion time
+        self.batch = Batch(device, (REG_BUS, REG_CURRENT, REG_POWER))
+        self._config = bytearray(2)
+        self._status = bytearray(2)
+        self.reads = 0
+        self.not_ready = 0              # polls that found the conversion still running
+        self.timeouts = 0               # conversions read without CNVR after twice the expected time
+        self.overflows = 0
+        self._total_us = 0
+        self.max_us = 0
+        self.running = False
+        self.configure(averaging)
+
+    def configure(self, averaging : int):
+        # averaging is the number of conversions averaged in hardware, a power of 2 up to 128
+        if averaging not in AVERAGING:
+            raise ValueError(f'averaging {averaging} not one of {sorted(AVERAGING)}')
+        self.averaging = averaging
+        adc = AVERAGING[averaging]
+        self._range_gain = self.ina._read_configuration() & RANGE_GAIN
+        self._adc = (adc << 7) | (adc << 3)
+        self.conversion_us = 2 * CONVERSION_US[adc]     # the shunt, then the bus
+        self._wait_us = max(self.conversion_us // self.polls, 500)
+
+    def reads_in(self, period_ms : int) -> int:
+        # how many reads fit in period_ms, at the conversion time plus a quarter for the CNVR polling
+        return period_ms * 1000 // (self.conversion_us * 5 // 4)
+
+    def _write_config(self, mode : int):
+        config = self._range_gain | self._adc | mode
+        self._config[0] = config >> 8
+        self._config[1] = config & 0xFF
+        self.device.writeto_mem(self.device.address, REG_CONFIG, self._config)
+
+    def start(self):
+        # replaces the driver's wake(), which would leave the chip converting continuously
+        self.running = True
+        self._write_config(MODE_TRIGGERED)
+
+    def stop(self):
+        self.running = False
+        self._write_config(MODE_POWER_DOWN)
+
+    async def read(self) -> tuple[float, float, float]:
+        # triggers a conversion and waits for it, returns volts (plus the diode drop), amps and watts
+        device = self.device
+        start = ticks_us()
+        self._write_config(MODE_TRIGGERED)
+        deadline = 2 * self.conversion_us
+        while True:
+            await asyncio.sleep(self._wait_us / 1000000)
+            device.readfrom_mem_into(device.address, REG_BUS, self._status)
+            if self._status[1] & CNVR or not self.running:
+                break   # ready, or stopped (powered down) while waiting
+            self.not_ready += 1
+            if ticks_diff(ticks_us(), start) > deadline:
+                self.timeouts += 1
+                break
+        batch = self.batch
+        device.bus.read(batch)
+        if not self.running:
+            self._write_config(MODE_POWER_DOWN)     # a read after stop, e.g. the rest of an oversampling fill
+        elapsed = ticks_diff(ticks_us(), start)
+        self.reads += 1
+        self._total_us += elapsed
+        if elapsed > self.max_us:
+            self.max_us = elapsed
+        bus = batch.unsigned(0)
+        if bus & OVF:
+            self.overflows += 1     # current or power past the calibrated range, the values are clipped
+        voltage = (bus >> 3) * .004 + self.diode_drop
+        current = batch.signed(1) * self.ina._current_lsb
+        power = batch.unsigned(2) * self.ina._power_lsb
+        return voltage, current, power
+
+    def stats(self) -> dict:
+        return {
+            'averaging': self.averaging,
+            'conversion_ms': self.conversion_us / 1000,
+            'reads': self.reads,
+            'read_ms': self._total_us / self.reads / 1000 if self.reads > 0 else 0,
+            'max_read_ms': self.max_us / 1000,
+            'not_ready': self.not_ready,
+            'timeouts': self.timeouts,
+            'overflows': self.overflows,
+        }
@@ -1,64 +1,422 @@
-import urequests
-from time import sleep
+from http_client import HttpClient
+import asyncio
+import time
 from sys import print_exception
+from clock import ticks_ms, ticks_diff, ticks_us
+
+# gzip for write bodies, MicroPython's deflate module (only builds with compression enabled can write),
+# or zlib on CPython. None when neither can compress.
+try:
+    import deflate
+    import io
+
+    def _gzip(data) -> bytes:
+        out = io.BytesIO()
+        f = deflate.DeflateIO(out, deflate.GZIP)
+        f.write(data)
+        f.close()
+        return out.getvalue()
+except ImportError:
+    try:
+        import zlib
+
+        def _gzip(data) -> bytes:
+            compressor = zlib.compressobj(wbits=31)
+            return compressor.compress(data) + compressor.flush()
+    except ImportError:
+        _gzip = None
 
 #from debug_print import print_, print_exception_
 
+# divisor from time.time_ns() to each precision= value accepted by the write api
+_PRECISION = {'s': 1000000000, 'ms': 1000000, 'us': 1000, 'ns': 1}
+
+# influx wants unix time, MicroPython ports with a 2000 epoch need moving forward
+_EPOCH_OFFSET = 946684800 if time.gmtime(0)[0] == 2000 else 0
+
+_INF = float('inf')
+
+def timestamp(precision : str = 'ms') -> int:
+    return (time.time_ns() + _EPOCH_OFFSET * 1000000000) // _PRECISION[precision]
+
 class Point:
-    def __init__(self, measurement, tags, value):
+    # tags is an iterable of (name, value) pairs. Passing the same tuple every time lets the encoder
+    # reuse the escaped measurement and tag prefix instead of rebuilding it for every point.
+    # A point has either a single value (written as the field "value") or a dict of named fields.
+    # timestamp is an int in the precision of the client that writes the point, see InfluxApiClient.timestamp(),
+    # without one influx stamps the point when it arrives.
+    def __init__(self, measurement, tags, value = None, timestamp : int = None, fields : dict = None):
         self.measurement = measurement
         self.tags = tags
         self.value = value
+        self.timestamp = timestamp
+        self.fields = fields
         
     def __str__(self):
-        tagstring = ''
-        for name,value in self.tags:
-            tagstring += f',{name}={value}'
-        return f'{self.measurement}{tagstring} value={self.value}' 
-        
+        encoder = LineEncoder(512)
+        encoder.encode(self)
+        return bytes(encoder.view[:max(encoder.length - 1, 0)]).decode('utf-8')
+
+def _escape(text : str, special : str) -> bytes:
+    for c in special:
+        if c in text:
+            text = text.replace(c, '\\' + c)
+    return text.encode('utf-8')
+
+# Writes points as line protocol straight into a preallocated buffer, one line (ending in a newline) per point.
+# The escaped "measurement,tag=value,..." prefix is cached per (measurement, tags) pair, so a point
+# that reuses its tags tuple only costs the formatting of its value and timestamp.
+class LineEncoder:
+    def __init__(self, size : int = 4096):
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.length = 0
+        self.skipped = 0
+        self._prefixes = {}
+        self._keys = {}
+
+    def reset(self):
+        self.length = 0
+
+    def _prefix(self, measurement : str, tags) -> bytes:
+        key = (measurement, tags)
+        try:
+            return self._prefixes[key]
+        except KeyError:
+            pass
+        except TypeError:
+            key = None  # tags is a set or list, can't be cached
+        prefix = bytearray(_escape(measurement, ', '))
+        for name, value in sorted(tags):
+            prefix += b','
+            prefix += _escape(name, ',= ')
+            prefix += b'='
+            prefix += _escape(str(value), ',= ')
+        prefix = bytes(prefix)
+        if key is not None:
+            if len(self._prefixes) >= 32:
+                self._prefixes.clear()
+            self._prefixes[key] = prefix
+        return prefix
+
+    def _field_value(self, value) -> bytes:
+        # ints are written without the i suffix, the existing series were created as floats
+        if isinstance(value, bool):
+            return b'true' if value else b'false'
+        if isinstance(value, str):
+            return b'"' + _escape(value, '\\"') + b'"'
+        if value != value or value == _INF or value == -_INF:
+            return None     # not representable in line protocol
+        return str(value).encode()
+
+    def _put(self, data) -> bool:
+        end = self.length + len(data)
+        if end > len(self.buffer):
+            return False
+        self.buffer[self.length:end] = data
+        self.length = end
+        return True
+
+    def _key(self, name : str) -> bytes:
+        # escaped field key with its = sign, field names are few and fixed so they are all kept
+        try:
+            return self._keys[name]
+        except KeyError:
+            key = _escape(name, ',= ') + b'='
+            self._keys[name] = key
+            return key
+
+    def _put_value(self, value) -> bool:
+        value = self._field_value(value)
+        if value is None:
+            raise ValueError('no fields')
+        return self._put(b' value=') and self._put(value)
+
+    def _put_fields(self, fields : dict) -> bool:
+        separator = b' '
+        for name, value in fields.items():
+            value = self._field_value(value)
+            if value is None:
+                continue
+            if not (self._put(separator) and self._put(self._key(name)) and self._put(value)):
+                return False
+            separator = b','
+        if separator == b' ':
+            raise ValueError('no fields')
+        return True
+
+    def encode(self, point : Point) -> bool:
+        # True when written, False when the buffer is full, None when the point was skipped because
+        # nothing in it can be written. The buffer is left as it was unless it returns True
+        start = self.length
+        try:
+            if (self._put(self._prefix(point.measurement, point.tags))
+                    and (self._put_value(point.value) if point.fields is None else self._put_fields(point.fields))
+                    and (point.timestamp is None or (self._put(b' ') and self._put(str(point.timestamp).encode())))
+                    and self._put(b'\n')):
+                return True
+        except ValueError:
+            # nothing in the point can be written
+            self.skipped += 1
+            self.length = start
+            return None
+        self.length = start
+        return False
+
+    def consume(self, length : int):
+        # remove the first length bytes (whole lines) from the buffer
+        remaining = self.length - length
+        if remaining > 0:
+            self.buffer[0:remaining] = self.buffer[length:self.length]
+        self.length = remaining
+
+    def drop_line(self) -> int:
+        # remove the oldest line from the buffer, returns its length
+        end = 0
+        while end < self.length and self.buffer[end] != 0x0A:
+            end += 1
+        end = min(end + 1, self.length)
+        self.consume(end)
+        return end
+
 class InfluxApiClient:
-    def __init__(self, url, organization, bucket, token):
+    def __init__(self, url, organization, bucket, token, precision : str = 'ms', timeout : float = 10, compress_min : int = 0):
         self.url = url
         self.organization = organization
         self.bucket = bucket
+        self.precision = precision
+        self.compress_min = compress_min    # gzip bodies of at least this many bytes, 0 to never compress
         self._token = token
+        # the request path and headers don't change, so they are encoded once
+        self._request = '/api/v2/write?org=' + self.organization + '&bucket=' + self.bucket + '&precision=' + precision
+        self._headers = (
+            f'Authorization: Token {self._token}\r\n'
+            'Content-Type: text/plain; charset=utf-8\r\n'
+            'Accept: application/json\r\n'
+        ).encode()
+        self._gzip_headers = self._headers + b'Content-Encoding: gzip\r\n'
+        self._http = HttpClient(url, timeout)
+        self.compressed = 0
+        self.last_ratio = 1.0
+        self.last_compress_us = 0
+        self._bytes_in = 0
+        self._bytes_out = 0
+
+    def timestamp(self) -> int:
+        # now, in this client's write precision
+        return timestamp(self.precision)
         
-    def write_data(self, points : list[Point]):
-        headers = {
-        'Authorization': f'Token {self._token}',
-        'Content-Type': 'text/plain; charset=utf-8',
-        'Accept': 'application/json'
-        }
-        request = self.url + '/api/v2/write?org=' + self.organization + '&bucket=' + self.bucket + '&precision=ns'
+    async def write_data(self, points : list[Point]) -> int:
         data = '\n'.join(str(p) for p in points)
+        return await self.write_lines(data)
 
-        #print(headers)
-        #print(request)
+    def _compress(self, data):
+        # gzip the body when it is big enough to be worth it, returns the body to send and its headers
+        if self.compress_min <= 0 or _gzip is None or len(data) < self.compress_min:
+            return data, self._headers
+        start = ticks_us()
+        try:
+            compressed = _gzip(data)
+        except (OSError, AttributeError, NotImplementedError) as e:
+            # this build can only decompress, stop trying
+            print(f'influxdb gzip not available, sending plain text : {e}')
+            self.compress_min = 0
+            return data, self._headers
+        self.last_compress_us = ticks_diff(ticks_us(), start)
+        self.last_ratio = len(data) / len(compressed)
+        self.compressed += 1
+        self._bytes_in += len(data)
+        self._bytes_out += len(compressed)
+        return compressed, self._gzip_headers
+
+    async def write_lines(self, data) -> int:
+        # post line protocol text, returns the http status (204 is success)
+        #print(self._request)
         #print(data)
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        body, headers = self._compress(data)
         
-        response = urequests.post(request, headers=headers, data=data)
-        if response.status_code != 204:
-            print(f'influxdb write failed {response.status_code} : {response.reason}\n{response.text}')
-        return response
+        status_code = await self._http.post(self._request, headers, body)
+        if status_code != 204:
+            print(f'influxdb write failed {status_code} : {self._http.reason}\n{bytes(self._http.body).decode()}')
+        return status_code
+
+    def compression_stats(self) -> dict:
+        return {
+            'compressed': self.compressed,
+            'ratio': self.last_ratio,
+            'overall_ratio': self._bytes_in / self._bytes_out if self._bytes_out > 0 else 1.0,
+            'compress_us': self.last_compress_us,
+        }
+
+    def close(self):
+        self._http.close()
     
-    def write_with_retry(self, data : list[Point], tries : int, delay : int):
+    async def write_with_retry(self, data : list[Point], tries : int, delay : int):
         attempts = 0
         success = False
+        lines = '\n'.join(str(p) for p in data)
         while not success and attempts < tries:
             try:
                 attempts = attempts + 1
-                self.write_data(data)
-                success = True
+                success = await self.write_lines(lines) == 204
             except Exception as e:
                 print_exception(e)
+            if not success and attempts < tries:
                 print(f"Write failed, attempt {attempts} of {tries} waiting {delay}") # add signal strength if we find a faster way to getit
-                sleep(delay)
+                await asyncio.sleep(delay)
         if not success:
             print(f"data lost after {tries} retries")
             return False
         else:
             return True
 
+REJECTED = (400, 413, 422)  # write statuses meaning the data itself is bad, sending it again won't help
+
+# Collects line protocol records between timer ticks and posts them as one request when the batch is
+# big enough (points or bytes) or the oldest record has waited long enough.
+# Points are encoded straight into a fixed size buffer, if writes keep failing the oldest lines are
+# dropped to make room, unless a spool is given, then a failed batch is moved to flash and replayed a
+# little at a time after the next successful write.
+class BatchWriter:
+    def __init__(self, client : InfluxApiClient, max_points : int = 70, max_bytes : int = 4096, max_age : int = 60, capacity : int = 8192, spool = None):
+        self.client = client
+        self.spool = spool
+        self.encoder = LineEncoder(capacity)
+        self.configure(max_points, max_bytes, max_age)
+        self._count = 0
+        self._oldest = 0
+        self._flushing = False
+        self._draining = False
+        self.dropped = 0
+        self.rejected = 0
+        self.flushes = 0
+        self.failures = 0
+        self.online = None          # whether the last write got through, None before the first one
+        self.last_batch_size = 0
+        self.last_flush_ms = 0
+        self.max_flush_ms = 0
+
+    def configure(self, max_points : int, max_bytes : int, max_age : int):
+        self.max_points = max(max_points, 1)
+        self.max_bytes = min(max(max_bytes, 256), len(self.encoder.buffer))
+        self.max_age = max(max_age, 0)
+
+    def add(self, points : list[Point]):
+        for point in points:
+            if self._count == 0:
+                self._oldest = ticks_ms()
+            encoded = self.encoder.encode(point)
+            while encoded is False:
+                if self._count == 0:
+                    raise ValueError('point larger than the write buffer')
+                if self._flushing:
+                    # the oldest lines are being sent, drop the new point instead
+                    self.dropped += 1
+                    break
+                self.encoder.drop_line()
+                self._count -= 1
+                self.dropped += 1
+                encoded = self.encoder.encode(point)
+            if encoded:
+                self._count += 1    # a skipped point (None) wasn't written, so isn't pending
+
+    def pending(self) -> int:
+        return self._count
+
+    def due(self) -> bool:
+        if self._count == 0:
+            return False
+        return (self._count >= self.max_points
+                or self.encoder.length >= self.max_bytes
+                or ticks_diff(ticks_ms(), self._oldest) >= self.max_age * 1000)
+
+    async def _write(self, data) -> bool:
+        # True when the data is done with, either written or rejected by influx as bad data.
+        # Any other failure, including auth (401, 403) and a missing bucket (404), which a fixed token
+        # or bucket will let through later, keeps the data to be sent again
+        try:
+            status_code = await self.client.write_lines(data)
+        except Exception as e:
+            print_exception(e)
+            return False
+        if status_code == 204:
+            return True
+        if status_code in REJECTED:
+            self.rejected += 1
+            return True
+        return False
+
+    async def flush(self) -> bool:
+        if self._count == 0:
+            return True
+        if self._flushing:
+            return False
+        self._flushing = True
+        try:
+            return await self._flush()
+        finally:
+            self._flushing = False
+
+    async def _flush(self) -> bool:
+        # points added while the write is in progress go in after the sent ones, and stay pending
+        count = self._count
+        length = self.encoder.length
+        data = self.encoder.view[:length]
+        start = ticks_ms()
+        success = await self._write(data)
+        elapsed = ticks_diff(ticks_ms(), start)
+        self.last_flush_ms = elapsed
+        if elapsed > self.max_flush_ms:
+            self.max_flush_ms = elapsed
+        self.online = success
+        if success:
+            self.flushes += 1
+            self.last_batch_size = count
+        else:
+            self.failures += 1
+            if self.spool is None:
+                return False
+            self.spool.append(data)
+            self.spool.sync()
+        self.encoder.consume(length)
+        self._count -= count
+        if self._count > 0:
+            self._oldest = ticks_ms()
+        if success and self.spool is not None:
+            await self.drain()
+        return success
+
+    async def drain(self, max_chunks : int = 4) -> int:
+        # replay spooled records, bounded so a long outage doesn't hold up newer batches when the link returns
+        # returns 0 when another drain is already running, two replays of the same segment would interleave
+        if self.spool is None or self._draining:
+            return 0
+        self._draining = True
+        try:
+            return await self.spool.drain(self._write, max_chunks)
+        finally:
+            self._draining = False
+
+    def stats(self) -> dict:
+        stats = {
+            'flushes': self.flushes,
+            'failures': self.failures,
+            'batch_size': self.last_batch_size,
+            'flush_ms': self.last_flush_ms,
+            'max_flush_ms': self.max_flush_ms,
+            'pending': self._count,
+            'pending_bytes': self.encoder.length,
+            'dropped': self.dropped,
+            'rejected': self.rejected,
+        }
+        if self.client.compress_min > 0:
+            stats['gzip'] = self.client.compression_stats()
+        if self.spool is not None:
+            stats['spool'] = self.spool.stats()
+        return stats
+
 if __name__ == "__main__":
     
     from wifi import Wifi
@@ -80,10 +438,5 @@ if __name__ == "__main__":
     points.append(Point("current",{('location','test'),('measurement','current'),('units','Amp')},.250))
     points.append(Point("power",{('location','test'),('measurement','power'),('units','Watt')},1.5))
 
-    r = client.write_data(points)
-    print(r)
-    print(r.text)
-    print(r.content)
-    print(r.status_code)
-    print(r.reason)
-    r.close()
\ No newline at end of file
+    print(asyncio.run(client.write_data(points)))
+    client.close()
\ No newline at end of file
@@ -1,44 +1,57 @@
 from wifi import Wifi
 from secrets import wifi as wifi_secrets
 from influxdb_api_client import Point
-from server import Request
-from machine import Timer, I2C, Pin
+from server import Request, WebServer
+from machine import I2C, Pin
 from time import sleep, localtime
 from ntptime import settime
 from _thread import allocate_lock
 from sys import print_exception
+import asyncio
 import gc
 from status import Status
+from bounded_queue import BoundedQueue
+from aggregate import Window, fill
+from display import Dashboard
+from i2cbus import I2CBus
+from ina_sampler import INASampler, AVERAGING
+from button import Button
 from lib.ina219 import INA219
 import logging
 
 lock = allocate_lock()
+runs = 0    # counts /start requests, so the sampler notices a stop and start between two samples
 
 def handle_request(request : Request, status : Status) -> str:
     #print('web request')
     #print(request.verb, request.command)
-    global timer
-    global ina
+    global sampler
+    global runs
     
     command = request.command.lower()
     if command == "/start":
         if status.get_state() == 'waiting':
+            runs += 1
             status.update_state('monitoring')
             status.reset_counter()
-            ina.wake()
-            location, delay = status.get_config()
-            timer.init(period=delay*1000, mode=Timer.PERIODIC, callback=fetch_and_write_data)
-            #start_new_thread(monitor_thread,(status,))
+            status.deadband.reset()
+            sampler.start()
+            monitoring.set()
+            status.scheduler.interrupt()
             print(f'---- Start monitoring request, using location {status.location}, delay {status.delay}')
-            status_blink(2)
+            asyncio.create_task(blink(2))
 
     elif command == "/stop":
         if status.get_state() == 'monitoring':
             status.update_state('waiting')
-            timer.deinit()
-            ina.sleep()
+            monitoring.clear()
+            status.scheduler.interrupt()
+            sampler.stop()
+            status.energy.pause()
+            status.save_rollups()
+            uploads.put(None)   # have the uploader flush what it has
             print(f'---- Stop monitoring request, logged {status.get_data_count()} data points')
-            status_blink(3)
+            asyncio.create_task(blink(3))
         
     elif command == "/config":
         if status.get_state() != 'waiting':
@@ -54,99 +67,300 @@ def handle_request(request : Request, status : Status) -> str:
                 delay = int(newdelay)
                 changedto = 'changed to '
         status.update_config(location, delay)
-        print(f'---- Configure request, location {status.location}, delay {changedto}{status.delay}')
+        settings = {}
+        for name in ('batch_points', 'batch_bytes', 'batch_age', 'gzip_min', 'oversample', 'adaptive', 'max_delay', 'low_battery', 'deadband', 'heartbeat', 'display_timeout'):
+            if name in request.parameters:
+                settings[name] = int(request.parameters[name])
+        if int(request.parameters.get('averaging', 0)) in AVERAGING:
+            settings['averaging'] = int(request.parameters['averaging'])
+        if request.parameters.get('layout') in ('legacy', 'fields'):
+            settings['layout'] = request.parameters['layout']
+        status.update_settings(settings)
+        status.scheduler.interrupt()
+        bands = {}
+        for name in UNITS:
+            # band_power=0.01 sets the absolute band, rel_power=0.05 the relative one
+            if 'band_' + name in request.parameters or 'rel_' + name in request.parameters:
+                absolute, relative = status.deadband.bands.get(name, (0, 0))
+                bands[name] = (float(request.parameters.get('band_' + name, absolute)), float(request.parameters.get('rel_' + name, relative)))
+        if len(bands) > 0:
+            status.update_bands(bands)
+        print(f'---- Configure request, location {status.location}, delay {changedto}{status.delay}, settings {status.get_settings()}')
     else:
         data_str = ''
-        if status.get_state == 'monitoring':
+        if status.get_state() == 'monitoring':
             data_str = f', {status.get_data_count()} data points captured'
         print(f'---- Status request, {status.state} location {status.location}, delay {status.delay}{data_str}')
+        print(f'---- influx {status.get_flush_stats()}, upload queue {uploads.qsize()} dropped {uploads.dropped}')
+        print(f'---- sampling {status.get_schedule_stats()}')
+        print(f'---- energy {status.get_energy_stats()}')
+        settings = status.get_settings()
+        if settings['adaptive']:
+            print(f'---- adaptive {status.get_adaptive_stats()}')
+        if settings['deadband']:
+            print(f'---- deadband {status.get_deadband_stats()}')
+        if status.dashboard is not None:
+            print(f'---- display {status.get_display_stats()}')
+        print(f'---- ina219 {status.get_sensor_stats()}')
+        print(f'---- i2c {status.get_i2c_stats()}')
     return ""
 
-def webserver_start(status : Status):
-    from server import WebServer
-    webserver = WebServer(status)
+UNITS = {'voltage': 'Volt', 'current': 'Amp', 'power': 'Watt', 'temperature': 'Fahrenheit', 'vsys': 'Volt', 'battery': 'Percent', 'freemem': 'Byte',
+         'energy_today': 'Watt-hour', 'charge_today': 'Milliamp-hour', 'energy_total': 'Watt-hour', 'charge_total': 'Milliamp-hour'}
+series_location = None
+series = {}
 
-    try:
-        webserver.listen(handle_request)
-        print('-- webserver listen stopped')
-        sleep(10)
-    except Exception as e:
-        print_exception(e)
-    except KeyboardInterrupt as ke:
-        print_exception(ke)
+def series_tags(location : str) -> dict:
+    # tag tuples per measurement, kept between samples so the influx encoder can reuse their line prefix
+    # 'solar' holds the shared tags for the multi field layout
+    global series_location
+    global series
+    if location != series_location:
+        series = {'solar': (('location',location),)}
+        for measurement, units in UNITS.items():
+            series[measurement] = (('location',location),('measurement',measurement),('units',units))
+        series_location = location
+    return series
 
-    print('-- webserver shutdown')
-    webserver.shutdown()
-    
-def fetch_and_write_data(timer : Timer):
-    global status
-    global timer_fired
+def build_points(readings : dict, spread : dict, location : str, timestamp : int, layout : str) -> list[Point]:
+    # 'fields' - one solar point per sample, with a field per reading
+    # 'legacy' - a measurement per reading, the layout the original grafana dashboards use
+    # spread is the oversampling summary {reading: (min, max, mean, stddev)}, added as extra fields
+    tags = series_tags(location)
+    if layout == 'fields':
+        fields = readings
+        if spread is not None:
+            fields = dict(readings)
+            for name, (low, high, mean, stddev) in spread.items():
+                fields[name + '_min'] = low
+                fields[name + '_max'] = high
+                fields[name + '_stddev'] = stddev
+        return [Point('solar', tags['solar'], timestamp=timestamp, fields=fields)]
+    points = []
+    for measurement, value in readings.items():
+        if spread is not None and measurement in spread:
+            low, high, mean, stddev = spread[measurement]
+            fields = {'value': value, 'min': low, 'max': high, 'stddev': stddev}
+            points.append(Point(measurement, tags[measurement], timestamp=timestamp, fields=fields))
+        else:
+            points.append(Point(measurement, tags[measurement], value, timestamp))
+    return points
+
+def changed_readings(deadband, readings : dict, spread : dict) -> tuple[dict, dict]:
+    # the readings (and their oversampling spread) that the deadband lets through
+    readings = deadband.filter(readings)
+    if spread is not None:
+        spread = {name: summary for name, summary in spread.items() if name in readings}
+    return readings, spread
+
+BUTTON_PIN = 15     # display button, to ground
+
+DIODE_DROP = .8 # need to put a .2 diode in here
+
+async def read_sample(status : Status, window : Window) -> tuple[dict, dict]:
+    # returns the readings, and the oversampling summary when the window has reads in it (else None)
     global freemem
-    global ina
-    
-    if timer_fired:
-        print('** timer fired, already busy')
-        status_blink(10,.1,.5)
-        return
+    global sampler
 
-    timer_fired = True
+    if freemem != gc.mem_free():
+        freemem = gc.mem_free()
+        if (freemem < 50000):
+            print(f'Memory is below 50K! : {freemem}')
+    gc.collect()
+    #print(f'** gc collect end {freemem}')
 
-    points = []
-    try:
-        if freemem != gc.mem_free():
-            freemem = gc.mem_free()
-            if (freemem < 50000):
-                print(f'Memory is below 50K! : {freemem}')
-        gc.collect()
-        #print(f'** gc collect end {freemem}')
-
-        if status.get_state() != 'monitoring':
-            print(f'** timer fired - not monitoring now')
-            timer_fired = False
-            return
-        
+    # a triggered INA219 conversion here, or use the mean of the reads taken since the last sample
+    #print('getting ina #s')
+    spread = window.summary()
+    if spread is None:
+        voltage, current, power = await sampler.read()
+    else:
+        voltage = spread['voltage'][2]
+        current = spread['current'][2]
+        power = spread['power'][2]
+        window.reset()
+    #print('getting temp')
+    temperature = status.get_pi_temp()
+    #print(voltage,current,power,temperature)
+
+    #print('getting vsys')
+    #vsys, percentage = status.get_battery_voltage(3.0, 4.2, adc_channel=3)
+    vsys, percentage = status.get_vsys_adc2(3.0,4.2)
+    #print(vsys,percentage)
+
+    readings = {'voltage': voltage, 'current': current, 'power': power, 'temperature': temperature,
+                'vsys': vsys, 'battery': percentage, 'freemem': freemem}
+    return readings, spread
+
+# The runtime is four asyncio tasks, connected by bounded queues so that none of them can hold up sampling:
+#   sample_task  - reads the sensors every delay seconds while monitoring (on drift free deadlines, see
+#                  Scheduler), queues the sample for the others. With oversample > 1 the INA219 is read
+#                  that many times between samples, and the sample carries their mean and spread
+#   upload_task  - batches samples into influx writes, network waits only block this task. drain_task
+#                  replays what was spooled during an outage in the background
+#   display_task - shows the latest sample on the dashboard, skipping any it didn't get to, and turns
+#                  the display off when idle. button_task pages through the dashboard and wakes it
+#   web server   - a task per client, see WebServer. Samples are also published to its event streams
+async def sample_task(status : Status, webserver : WebServer):
+    scheduler = status.scheduler
+    window = Window(64)
+    while True:
+        await monitoring.wait()
+        run = runs
         location, delay = status.get_config()
-        now = localtime()
+        settings = status.get_settings()
+        oversample = min(settings['oversample'], window.capacity)
+        adaptive = status.adaptive if settings['adaptive'] else None
+        if adaptive is not None:
+            adaptive.low_battery = settings['low_battery']
+            adaptive.configure(delay, settings['max_delay'])
+        period = delay
+        window.reset()
+        if settings['averaging'] != sampler.averaging:
+            sampler.configure(settings['averaging'])
+        scheduler.start(delay * 1000)
 
-        print(f'** {now[3]}:{now[4]}:{now[5]} : timer fired, monitoring location {location}, delay {delay}')
-        
-        # fetch from ina219 here
-        #print('getting ina #s')
-        diode_drop = .8 # need to put a .2 diode in here
-        voltage = ina.voltage() + diode_drop # volts
-        current = ina.current() / 1000 # reading is amps, convert to milliamps
-        power = ina.power() / 1000 # reading is watts, convert to milliwatts
-        #print('getting temp')
-        temperature = status.get_pi_temp()
-        #print(ina.voltage(),ina.current(),ina.power())
-        #print(voltage,current,power,temperature)
-
-        #print('getting vsys')
-        #vsys, percentage = status.get_battery_voltage(3.0, 4.2, adc_channel=3)
-        vsys, percentage = status.get_vsys_adc2(3.0,4.2)
-        #print(vsys,percentage)
-
-        points.append(Point("voltage",{('location',location),('measurement','voltage'),('units','Volt')},voltage))
-        points.append(Point("current",{('location',location),('measurement','current'),('units','Amp')},current))
-        points.append(Point("power",{('location',location),('measurement','power'),('units','Watt')},power))
-        points.append(Point("temperature",{('location',location),('measurement','temperature'),('units','Fahrenheit')},temperature))
-        points.append(Point("vsys",{('location',location),('measurement','vsys'),('units','Volt')},vsys))
-        points.append(Point("battery",{('location',location),('measurement','battery'),('units','Percent')},percentage))
-        points.append(Point("freemem",{('location',location),('measurement','freemem'),('units','Byte')},freemem))
-
-        #print(f'influx write start {status.get_data_count()}')
-        if status.influxdbclient.write_with_retry(points, tries=1, delay=1):
-            count = status.increment_counter()
-            if count % 100 == 0:
-                print(f'++ Recorded {count} records')
-        #print(f'influx write end {status.get_data_count()}')
-        status.status_blink(1)
+        def current() -> bool:
+            # False once stopped, restarted, or the config or settings changed
+            return (monitoring.is_set() and runs == run and status.get_settings() is settings
+                    and status.get_config() == (location, delay))
 
-    except Exception as e:
-        print_exception(e)
-    finally:
-        timer_fired = False
-        points = None
+        while True:
+            jitter = await scheduler.wait()
+            if not current():
+                break
+            if jitter is None:
+                continue
+            try:
+                now = localtime()
+                print(f'** {now[3]}:{now[4]}:{now[5]} : sample, monitoring location {location}, delay {delay}')
+                readings, spread = await read_sample(status, window)
+                timestamp = status.influxdbclient.timestamp()
+                energy = status.energy
+                energy.set_interval(period)
+                energy.add(readings['power'], readings['current'])
+                readings['energy_today'] = energy.today_wh
+                readings['charge_today'] = energy.today_mah
+                readings['energy_total'] = energy.total_wh
+                readings['charge_total'] = energy.total_mah
+                sample = (timestamp, location, readings, spread)
+                uploads.put(sample)
+                displays.put(sample)
+                count = status.increment_counter()
+                status.record_sample(timestamp, readings)
+                webserver.publish(timestamp, readings)
+                if count % 100 == 0:
+                    print(f'++ Recorded {count} records')
+                asyncio.create_task(blink(1, end_delay=0))
+                if adaptive is not None:
+                    period = adaptive.update(readings['power'], readings['voltage'], readings['battery'])
+                    scheduler.set_period(period * 1000)
+                if oversample > 1:
+                    # spread the reads over most of the interval, leaving time to summarise before the next deadline,
+                    # no more of them than fit in it
+                    reads = min(oversample, sampler.reads_in(period * 900))
+                    if reads > 1:
+                        await fill(window, sampler.read, reads, period * 900, current)
+            except Exception as e:
+                print_exception(e)
+
+async def upload_task(status : Status):
+    writer = status.influxwriter
+    while True:
+        sample = await uploads.get()
+        try:
+            if sample is not None:
+                timestamp, location, readings, spread = sample
+                settings = status.get_settings()
+                if settings['deadband']:
+                    readings, spread = changed_readings(status.deadband, readings, spread)
+                if len(readings) > 0:
+                    writer.add(build_points(readings, spread, location, timestamp, settings['layout']))
+            # queue the sample, only post to influx once a batch is due (or monitoring stopped)
+            if writer.due() or (sample is None and writer.pending() > 0):
+                #print(f'influx write start {writer.pending()}')
+                if not await writer.flush() and sample is None:
+                    print(f'-- upload, {writer.pending()} points still pending')
+        except Exception as e:
+            print_exception(e)
+
+async def drain_task(status : Status, interval : float = 30):
+    # replays the spool whenever there is something in it and wifi is up, monitoring or not, so what
+    # was spooled during an outage doesn't wait for the next batch (none come after /stop, or while the
+    # deadband holds everything back). A failed replay waits for the next interval
+    writer = status.influxwriter
+    spool = writer.spool
+    while True:
+        await asyncio.sleep(interval)
+        if spool is None or spool.pending() == 0 or wifi.status() != 3:
+            continue
+        try:
+            while spool.pending() > 0 and await writer.drain() > 0:
+                await asyncio.sleep(0)  # let the other tasks in between chunks
+        except Exception as e:
+            print_exception(e)
+
+def link_state(status : Status) -> str:
+    # wifi and influx state for the display
+    if wifi.status() != 3:
+        return 'no wifi'
+    online = status.influxwriter.online
+    if online is None:
+        return 'wifi ok'
+    if online:
+        return 'influx ok'
+    return 'influx down'
+
+def system_values(status : Status) -> dict:
+    # fields of the energy and system pages
+    values = status.get_energy_stats()
+    values['state'] = status.state
+    values['samples'] = status.get_data_count()
+    values['period'] = status.scheduler.period_ms / 1000
+    values['free_kb'] = gc.mem_free() / 1024
+    return values
+
+async def display_task(status : Status, dashboard : Dashboard, refresh : float = 1):
+    while True:
+        sample = None
+        while displays.qsize() > 0:
+            sample = displays.get_nowait()  # only the newest sample is worth drawing
+        try:
+            if sample is not None:
+                timestamp, location, readings, spread = sample
+                dashboard.update(readings, location, link_state(status))
+            if dashboard.on and dashboard.page > 0:
+                dashboard.update_values(system_values(status))
+                dashboard.update_values({'link': link_state(status)})
+            if dashboard.sleep_if_idle(status.get_settings()['display_timeout']):
+                print('-- display off')
+            dashboard.render()
+        except Exception as e:
+            print_exception(e)
+        await asyncio.sleep(refresh)
+
+async def button_task(status : Status, dashboard : Dashboard, button : Button):
+    # pages are drawn straight away rather than at the next refresh
+    while True:
+        if await button.pressed():
+            try:
+                dashboard.press()
+                if dashboard.page > 0:
+                    dashboard.update_values(system_values(status))
+                dashboard.render()
+            except Exception as e:
+                print_exception(e)
+
+async def blink(count : int = 1, toggle_delay : float = .2, end_delay : float = 2):
+    global led_pin
+    
+    for repeat in range(count):
+        led_pin.on()
+        await asyncio.sleep(toggle_delay)
+        led_pin.off()
+        if repeat < count:
+            await asyncio.sleep(toggle_delay)
+    await asyncio.sleep(end_delay)
     return
 
 def status_blink(count : int = 1, toggle_delay : float = .2, end_delay : float = 2):
@@ -161,6 +375,27 @@ def status_blink(count : int = 1, toggle_delay : float = .2, end_delay : float =
     sleep(end_delay)
     return
 
+async def run(status : Status, display):
+    webserver = WebServer(status)
+    await webserver.start(handle_request)
+    tasks = [asyncio.create_task(sample_task(status, webserver)),
+             asyncio.create_task(upload_task(status)),
+             asyncio.create_task(drain_task(status))]
+    if display is not None:
+        dashboard = Dashboard(display)
+        status.dashboard = dashboard
+        tasks.append(asyncio.create_task(display_task(status, dashboard)))
+        if status.button is not None:
+            tasks.append(asyncio.create_task(button_task(status, dashboard, status.button)))
+    try:
+        while True:
+            await asyncio.sleep(60)
+    finally:
+        print('-- webserver shutdown')
+        webserver.shutdown()
+        for task in tasks:
+            task.cancel()
+
 if __name__ == "__main__":
     """
     Led blink sequence on startup
@@ -206,23 +441,23 @@ if __name__ == "__main__":
     status = Status(lock)
     location, delay = status.get_config()
     
-    timer_fired = False
-    timer = Timer()
-
+    # one I2C for everything on the bus, the drivers get I2CBus devices
     sda = Pin(10)
     scl = Pin(11)
-    i2c = I2C(1, sda=sda, scl=scl, freq=400000)
+    bus = I2CBus(I2C(1, sda=sda, scl=scl, freq=400000))
+    status.bus = bus
 
-    I2C_INTERFACE_NO = 1
     SHUNT_OHMS = 0.1  # Check value of shunt used with your INA219
 
-    ina = INA219(SHUNT_OHMS, I2C(I2C_INTERFACE_NO), log_level=logging.INFO)
+    ina = INA219(SHUNT_OHMS, bus.device(0x40, 'ina219'), log_level=logging.INFO)
     ina.configure(voltage_range=INA219.RANGE_16V, gain=INA219.GAIN_1_40MV )
+    sampler = INASampler(ina, bus.device(0x40, 'ina219'), status.get_settings()['averaging'], DIODE_DROP)
+    status.sensor = sampler
 
     # scan i2c - should find
     # ina219 at x40
-    # ssd1306 at x3C (todo)
-    devices = i2c.scan()
+    # ssd1306 at x3C
+    devices = bus.scan()
     for d in devices:
         print(f'found {hex(d)}')
     if len(devices) < 1:
@@ -231,18 +466,32 @@ if __name__ == "__main__":
     else:
         status_blink(4)
 
-    ina.sleep()
+    display = None
+    if 0x3C in devices:
+        from ssd1306 import SSD1306_I2C
+        display = SSD1306_I2C(128, 64, bus.device(0x3C, 'ssd1306'), diff=True)
+        status.button = Button(BUTTON_PIN)
+
+    sampler.stop()
 
     freemem = 0
     
     while True:
         status_blink(5)
-        print('-- starting webserver')
-        webserver_start(status)
-        # webserver should run forever unless it crashes.
-        # we do want to restart it, but may need to clean some things up (or start  might not work)
-        print('-- stopping timer')
-        timer.deinit()
+        print('-- starting tasks')
+        monitoring = asyncio.Event()
+        uploads = BoundedQueue(32)
+        displays = BoundedQueue(2)
+        try:
+            asyncio.run(run(status, display))
+        except Exception as e:
+            print_exception(e)
+        except KeyboardInterrupt as ke:
+            print_exception(ke)
+            break
+        # tasks should run forever unless something crashes.
+        # we do want to restart, but may need to clean some things up (or start might not work)
+        print('-- stopping monitoring')
+        status.update_state('waiting')
+        asyncio.new_event_loop()
         sleep(10)
-
-    
@@ -0,0 +1,160 @@
+from array import array
+import os
+from history import CHANNELS
+
+# Minute, hour and day summaries (min, max, mean and count per channel) of every sample, covering
+# much more time than the raw History in a few KB.
+# Each tier is a ring of buckets in preallocated arrays. A sample only updates the open minute bucket,
+# when a minute bucket closes it is folded into the open hour bucket, and a closed hour into the day,
+# so the cost per sample stays the same whatever the tier sizes (an open hour doesn't include the
+# open minute yet). Buckets are aligned on unix time, days start at midnight UTC.
+# The tiers are saved to flash (written to a new file then renamed) each time an hour closes, and
+# when monitoring stops. The minute tier is saved too, but is mostly stale after a restart.
+_INF = float('inf')
+
+class Tier:
+    def __init__(self, name : str, seconds : int, capacity : int, channels : int):
+        self.name = name
+        self.seconds = seconds
+        self.capacity = capacity
+        self.state = array('i', [-1, 0])   # open bucket index, buckets in use
+        self.starts = array('I', bytearray(4 * capacity))
+        self.counts = array('I', bytearray(4 * capacity))
+        self.lows = [array('f', bytearray(4 * capacity)) for c in range(channels)]
+        self.highs = [array('f', bytearray(4 * capacity)) for c in range(channels)]
+        self.totals = [array('f', bytearray(4 * capacity)) for c in range(channels)]
+
+    def arrays(self) -> list:
+        # everything that is saved, in file order
+        return [self.state, self.starts, self.counts] + self.lows + self.highs + self.totals
+
+    def _bucket(self, seconds : int) -> int:
+        # makes sure the bucket for seconds is open, returns the index of the bucket that closed (-1 if none)
+        start = seconds - seconds % self.seconds
+        current = self.state[0]
+        if current >= 0 and self.starts[current] == start:
+            return -1
+        index = (current + 1) % self.capacity
+        self.state[0] = index
+        if self.state[1] < self.capacity:
+            self.state[1] += 1
+        self.starts[index] = start
+        self.counts[index] = 0
+        for c in range(len(self.lows)):
+            self.lows[c][index] = _INF
+            self.highs[c][index] = -_INF
+            self.totals[c][index] = 0
+        return current
+
+    def add(self, seconds : int, readings : dict, channels : tuple) -> int:
+        # one sample, returns the index of the bucket it closed (-1 if none)
+        closed = self._bucket(seconds)
+        index = self.state[0]
+        self.counts[index] += 1
+        for c in range(len(channels)):
+            value = readings[channels[c]]
+            if value < self.lows[c][index]:
+                self.lows[c][index] = value
+            if value > self.highs[c][index]:
+                self.highs[c][index] = value
+            self.totals[c][index] += value
+        return closed
+
+    def merge(self, tier, source : int) -> int:
+        # folds a closed bucket of a finer tier into this one, returns the index of the bucket it closed
+        closed = self._bucket(tier.starts[source])
+        index = self.state[0]
+        self.counts[index] += tier.counts[source]
+        for c in range(len(self.lows)):
+            if tier.lows[c][source] < self.lows[c][index]:
+                self.lows[c][index] = tier.lows[c][source]
+            if tier.highs[c][source] > self.highs[c][index]:
+                self.highs[c][index] = tier.highs[c][source]
+            self.totals[c][index] += tier.totals[c][source]
+        return closed
+
+    def query(self, channels : tuple) -> dict:
+        # the buckets oldest first, including the open one
+        result = {'tier': self.name, 'seconds': self.seconds, 'time': [], 'count': []}
+        for channel in channels:
+            result[channel] = {'min': [], 'max': [], 'mean': []}
+        current, buckets = self.state
+        for i in range(buckets):
+            index = (current - buckets + 1 + i) % self.capacity
+            count = self.counts[index]
+            if count == 0:
+                continue
+            result['time'].append(self.starts[index])
+            result['count'].append(count)
+            for c in range(len(channels)):
+                column = result[channels[c]]
+                column['min'].append(round(self.lows[c][index], 4))
+                column['max'].append(round(self.highs[c][index], 4))
+                column['mean'].append(round(self.totals[c][index] / count, 4))
+        return result
+
+class Rollups:
+    def __init__(self, path : str = 'rollups.bin', channels : tuple = CHANNELS, minutes : int = 60, hours : int = 48, days : int = 90):
+        self.path = path
+        self.channels = channels
+        self.minute = Tier('minute', 60, minutes, len(channels))
+        self.hour = Tier('hour', 3600, hours, len(channels))
+        self.day = Tier('day', 86400, days, len(channels))
+        self.tiers = {'minute': self.minute, 'hour': self.hour, 'day': self.day}
+        self.load()
+
+    def add(self, seconds : int, readings : dict):
+        closed = self.minute.add(seconds, readings, self.channels)
+        if closed >= 0:
+            closed = self.hour.merge(self.minute, closed)
+            if closed >= 0:
+                self.day.merge(self.hour, closed)
+                self.save()
+
+    def query(self, tier : str) -> dict:
+        # KeyError for an unknown tier
+        return self.tiers[tier].query(self.channels)
+
+    def _arrays(self) -> list:
+        return self.minute.arrays() + self.hour.arrays() + self.day.arrays()
+
+    def load(self):
+        arrays = self._arrays()
+        size = sum(len(a) * a.itemsize for a in arrays)
+        try:
+            if os.stat(self.path)[6] != size:
+                print(f'rollups {self.path} is for different tier sizes, starting again')
+                return
+            with open(self.path, 'rb') as f:
+                for a in arrays:
+                    f.readinto(a)
+        except OSError:
+            pass    # nothing saved yet
+
+    def save(self):
+        try:
+            with open(self.path + '.tmp', 'wb') as f:
+                for a in self._arrays():
+                    f.write(a)
+            os.rename(self.path + '.tmp', self.path)
+        except OSError as e:
+            print(f'rollups save failed {e}')
+
+if __name__ == "__main__":
+    # three days of 30 second samples, then a reload from flash
+    #   PYTHONPATH=.:host python3 rollups.py
+    import time
+    path = 'rollups-test.bin'
+    rollups = Rollups(path)
+    start = 1700000000 - 1700000000 % 86400
+    t = time.perf_counter()
+    for i in range(3 * 2880):
+        seconds = start + i * 30
+        rollups.add(seconds, {'voltage': 6 + (i % 2880) / 2880, 'current': .1, 'power': .6, 'battery': 80})
+    elapsed = (time.perf_counter() - t) / (3 * 2880) * 1e6
+    rollups.save()
+    days = Rollups(path).query('day')
+    print(f'{elapsed:.1f} us per sample, days {days["time"]} counts {days["count"]}')
+    print(f'voltage min {days["voltage"]["min"]} max {days["voltage"]["max"]} mean {days["voltage"]["mean"]}')
+    print(f'hours kept {len(rollups.query("hour")["time"])}, minutes kept {len(rollups.query("minute")["time"])}')
+    os.remove(path)
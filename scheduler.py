@@ -0,0 +1,110 @@
+import asyncio
+from array import array
+from clock import ticks_ms, ticks_diff, ticks_add
+
+# Periodic deadlines for the sampling task, measured from an absolute start with the tick counter.
+# Each deadline is the previous deadline plus the period, never "now plus the period", so time spent
+# sampling or waiting on other tasks doesn't accumulate as drift.
+# For every tick the lateness (actual - scheduled) goes into a histogram. When a wait wakes more than a
+# whole period late, the skipped deadlines are counted as missed instead of being run back to back.
+# interrupt() wakes a wait early (or makes the next one return at once), so a change of state or settings
+# doesn't have to wait out a long interval.
+class Scheduler:
+    # histogram bucket upper bounds in ms, the last bucket counts everything later
+    BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250, 500, 1000)
+
+    def __init__(self, period_ms : int, tolerance_ms : int = 100):
+        self.tolerance_ms = tolerance_ms
+        self.histogram = array('I', [0] * (len(self.BUCKETS) + 1))
+        self._interrupt = asyncio.Event()
+        self.start(period_ms)
+
+    def start(self, period_ms : int = None):
+        if period_ms is not None:
+            self.period_ms = period_ms
+        self._next = ticks_ms()
+        self.ticks = 0
+        self.missed = 0
+        self.late = 0           # ticks outside the tolerance
+        self.max_ms = 0
+        self._total_ms = 0
+        for i in range(len(self.histogram)):
+            self.histogram[i] = 0
+
+    def set_period(self, period_ms : int):
+        # the deadline already scheduled moves too, so the new period applies from the last tick
+        self._next = ticks_add(self._next, period_ms - self.period_ms)
+        self.period_ms = period_ms
+
+    def interrupt(self):
+        self._interrupt.set()
+
+    async def wait(self) -> int:
+        # sleep until the next deadline, returns how many ms after it we woke up,
+        # or None when interrupted (the deadline stays where it was)
+        delay = ticks_diff(self._next, ticks_ms())
+        if delay > 0 and not self._interrupt.is_set():
+            try:
+                await asyncio.wait_for(self._interrupt.wait(), delay / 1000)
+            except asyncio.TimeoutError:
+                pass
+        if self._interrupt.is_set():
+            self._interrupt.clear()
+            return None
+        jitter = ticks_diff(ticks_ms(), self._next)
+        if jitter >= self.period_ms:
+            missed = jitter // self.period_ms
+            self.missed += missed
+            self._next = ticks_add(self._next, missed * self.period_ms)
+            jitter -= missed * self.period_ms
+        if jitter < 0:
+            jitter = 0
+        self._record(jitter)
+        self._next = ticks_add(self._next, self.period_ms)
+        return jitter
+
+    def _record(self, jitter : int):
+        self.ticks += 1
+        self._total_ms += jitter
+        if jitter > self.max_ms:
+            self.max_ms = jitter
+        if jitter > self.tolerance_ms:
+            self.late += 1
+        bucket = 0
+        while bucket < len(self.BUCKETS) and jitter > self.BUCKETS[bucket]:
+            bucket += 1
+        self.histogram[bucket] += 1
+
+    def stats(self) -> dict:
+        histogram = {}
+        for i, count in enumerate(self.histogram):
+            if count > 0:
+                histogram[f'<={self.BUCKETS[i]}' if i < len(self.BUCKETS) else f'>{self.BUCKETS[-1]}'] = count
+        return {
+            'period_ms': self.period_ms,
+            'ticks': self.ticks,
+            'missed': self.missed,
+            'late': self.late,
+            'mean_ms': self._total_ms / self.ticks if self.ticks > 0 else 0,
+            'max_ms': self.max_ms,
+            'jitter_ms': histogram,
+        }
+
+if __name__ == "__main__":
+    # 2 second sampling with a busy neighbour task, on the host: PYTHONPATH=host python3 scheduler.py
+    import time
+
+    async def busy():
+        while True:
+            time.sleep(0.05)    # blocking work elsewhere, like a slow flash write
+            await asyncio.sleep(0.3)
+
+    async def main():
+        scheduler = Scheduler(2000)
+        asyncio.create_task(busy())
+        for i in range(10):
+            jitter = await scheduler.wait()
+            print(f'tick {i} jitter {jitter} ms')
+        print(scheduler.stats())
+
+    asyncio.run(main())
@@ -10,5 +10,6 @@ influxdb = {
     'url': '<influxdb url>',
     'organization': '<organization>',
     'bucket': '<bucket>',
-    'token': '<token>'
+    'token': '<token>',
+    'precision': 'ms'
 }
\ No newline at end of file
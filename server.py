@@ -1,52 +1,294 @@
-import socket
+import asyncio
+import json
 from sys import print_exception
 from status import Status
+from bounded_queue import BoundedQueue
+from static import StaticFiles
+from clock import ticks_ms, ticks_diff
 import _thread
 
+# Request parsing works on the bytes as they were received (a memoryview of the connection's buffer),
+# walking them byte by byte instead of decoding the whole request and splitting it into lines. Only
+# the method, path, query parameters and the headers in HEADERS become strings, everything else is
+# skipped over. Query (and form) values are percent decoded.
+HEADERS = (b'content-length', b'content-type', b'accept-encoding', b'if-none-match')
+_FIRST = tuple(set(name[0] for name in HEADERS))   # lines starting with anything else are skipped
+
+def _find(view, byte : int, start : int, end : int) -> int:
+    while start < end:
+        if view[start] == byte:
+            return start
+        start += 1
+    return -1
+
+def _trim(view, start : int, end : int) -> tuple[int, int]:
+    while start < end and view[start] in (0x20, 0x09):
+        start += 1
+    while end > start and view[end - 1] in (0x20, 0x09, 0x0D):
+        end -= 1
+    return start, end
+
+def _hex(byte : int) -> int:
+    if 0x30 <= byte <= 0x39:
+        return byte - 0x30
+    byte |= 0x20
+    if 0x61 <= byte <= 0x66:
+        return byte - 0x57
+    return -1
+
+def _unquote(view, start : int, end : int) -> str:
+    # percent and + decoding, only copies when there's something to decode
+    i = start
+    while i < end and view[i] != 0x25 and view[i] != 0x2B:
+        i += 1
+    if i == end:
+        return str(view[start:end], 'utf-8')
+    decoded = bytearray(view[start:i])
+    while i < end:
+        byte = view[i]
+        if byte == 0x2B:
+            byte = 0x20
+        elif byte == 0x25 and i + 2 < end and _hex(view[i + 1]) >= 0 and _hex(view[i + 2]) >= 0:
+            byte = _hex(view[i + 1]) * 16 + _hex(view[i + 2])
+            i += 2
+        decoded.append(byte)
+        i += 1
+    return str(decoded, 'utf-8')
+
+def head_end(view, start : int, end : int) -> int:
+    # offset just past the blank line ending the request head, -1 when it isn't in view[start:end] yet
+    i = _find(view, 0x0A, start, end)
+    while i >= 0:
+        if i + 1 < end and view[i + 1] == 0x0A:
+            return i + 2
+        if i + 2 < end and view[i + 1] == 0x0D and view[i + 2] == 0x0A:
+            return i + 3
+        i = _find(view, 0x0A, i + 1, end)
+    return -1
+
 class Request:
-    def __init__(self, request : bytes):
+    def __init__(self, request : bytes, body : bytes = b''):
+        # request is the head (request line and headers), raises ValueError when it isn't http
         self.verb : str = ''
         self.requestline : str = ''
         self.command : str = ''
         self.parameters : dict[str,str] = {}
-        self.headers : dict[str,str] = {}
-        
-        if len(request) > 0:
-            lines = request.decode('utf-8').split('\r\n')
-            parts = lines[0].split(' ')
-            self.verb = parts[0]
-            self.requestline = parts[1]
-            parts = self.requestline.split('?')
-            self.command = parts[0]
-            if len(parts) > 1:
-                params = parts[1].split('&')
-                for nvps in params:
-                    nvp = nvps.split('=')
-                    if len(nvp) > 1:
-                        self.parameters[nvp[0].lower()] = nvp[1].strip()
-                    elif len(nvp) == 1:
-                        self.parameters[nvp[0].lower()] = ''
-            
-            for header in range(1,len(lines)):
-                parts = lines[header].split(':')
-                if len(parts) > 1:
-                    self.headers[parts[0]] = parts[1].strip()
+        self.headers : dict[str,str] = {}   # lower case names, only the ones in HEADERS
+        self.body : bytes = b''
+        self.length : int = 0               # content-length
+
+        view = memoryview(request)
+        end = len(view)
+        if end == 0:
+            return
+        line = _find(view, 0x0A, 0, end)
+        if line < 0:
+            line = end
+        first = _find(view, 0x20, 0, line)
+        second = _find(view, 0x20, first + 1, line) if first > 0 else -1
+        if second < 0:
+            raise ValueError('bad request line')
+        self.verb = str(view[:first], 'utf-8')
+        self.requestline = str(view[first + 1:second], 'utf-8')
+        query = _find(view, 0x3F, first + 1, second)
+        if query < 0:
+            self.command = self.requestline
+        else:
+            self.command = str(view[first + 1:query], 'utf-8')
+            self._parameters(view, query + 1, second)
+
+        start = line + 1
+        while start < end:
+            line = _find(view, 0x0A, start, end)
+            if line < 0:
+                line = end
+            colon = _find(view, 0x3A, start, line) if view[start] | 0x20 in _FIRST else -1
+            if colon > start:
+                for name in HEADERS:
+                    if colon - start == len(name) and self._is(view, start, name):
+                        value, value_end = _trim(view, colon + 1, line)
+                        self.headers[str(name, 'utf-8')] = str(view[value:value_end], 'utf-8')
+                        break
+            start = line + 1
+        if 'content-length' in self.headers:
+            self.length = int(self.headers['content-length'])
+        if len(body) > 0:
+            self.set_body(body)
+
+    def _is(self, view, start : int, name : bytes) -> bool:
+        # case insensitive compare of a header name (name is lower case)
+        for i in range(len(name)):
+            if view[start + i] | 0x20 != name[i]:
+                return False
+        return True
 
+    def _parameters(self, view, start : int, end : int):
+        while start < end:
+            stop = _find(view, 0x26, start, end)
+            if stop < 0:
+                stop = end
+            equals = _find(view, 0x3D, start, stop)
+            if equals < 0:
+                self.parameters[_unquote(view, start, stop).lower()] = ''
+            else:
+                value, value_end = _trim(view, equals + 1, stop)
+                self.parameters[_unquote(view, start, equals).lower()] = _unquote(view, value, value_end)
+            start = stop + 1
+
+    def set_body(self, body):
+        self.body = body
+        # a form post carries its parameters in the body instead of the query string
+        if len(body) > 0 and 'x-www-form-urlencoded' in self.header('Content-Type'):
+            self._parameters(memoryview(body), 0, len(body))
+
+    def header(self, name : str) -> str:
+        # header value by case insensitive name, '' when it wasn't sent (or isn't in HEADERS)
+        return self.headers.get(name.lower(), '')
+
+async def _readinto(reader, view) -> int:
+    # MicroPython streams read straight into the buffer, CPython's (on the host) only return new bytes
+    if hasattr(reader, 'readinto'):
+        return await reader.readinto(view)
+    data = await reader.read(len(view))
+    view[:len(data)] = data
+    return len(data)
+
+SSE_HEADERS = b'HTTP/1.0 200 OK\r\nContent-type: text/event-stream\r\nCache-Control: no-cache\r\n\r\nretry: 5000\n\n'
+SSE_KEEPALIVE = b': keepalive\n\n'
+
+class _Stream:
+    # an /api/stream subscriber, its queue of events and the task writing them
+    def __init__(self, size : int):
+        self.queue = BoundedQueue(size)
+        self.task = asyncio.current_task()
+        self.writing = None     # ticks_ms when the write in progress started, None while waiting for an event
+
+# Each client is served by its own task, so a slow browser only holds up itself. The request head is
+# read into a preallocated buffer up to the blank line (so requests larger than one read work), and a
+# Content-Length body after it. Every client gets timeout seconds for its whole request; past max_clients open
+# connections, or a head over max_head bytes, the client gets an error response straight away.
+# /api/stream is a server sent events stream of the samples. publish() encodes each sample once and
+# puts the same bytes in every subscriber's small queue, a subscriber that can't keep up loses its
+# oldest events instead of holding up the sampler. Streams don't count against max_clients, they have
+# their own limit of max_streams.
+# A stream task only waits on its queue and its writes, with no timeout of its own. One timer task
+# for all the streams puts a keepalive comment in their queues when nothing was published for
+# keepalive seconds (lets the browser, and us, notice a dead connection), and cancels a stream whose
+# write has been stuck for timeout seconds, a client that stopped reading.
 class WebServer:
-    def __init__(self, status : Status, port=80):
-        # Open socket
+    def __init__(self, status : Status, port=80, max_clients : int = 4, timeout : float = 5, max_head : int = 2048, max_body : int = 1024,
+                 max_streams : int = 2, stream_queue : int = 4, keepalive : float = 15):
         self.status = status
-        self.addr = socket.getaddrinfo('0.0.0.0', port)[0][-1]
         self.port = port
- 
-        self._socket = socket.socket()
-        self._socket.bind(self.addr)
-        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self._socket.listen(1)
-    
-        print('-- listening on', self.addr)
+        self.max_clients = max_clients
+        self.timeout = timeout
+        self.max_head = max_head
+        self.max_body = max_body
+        self._buffers = [bytearray(max_head + max_body) for i in range(max_clients)]   # a receive buffer per client
+        self.handler = None
+        self.static = StaticFiles()
+        self._server = None
+        self.clients = 0
+        self.served = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.max_streams = max_streams
+        self.stream_queue = stream_queue
+        self.keepalive = keepalive
+        self.subscribers = []
+        self.published = 0
+        self.stream_dropped = 0
+        self._last_event = ticks_ms()
+        self._watcher = None
+
+    async def start(self, handler):
+        # Open socket, clients are served by their own task
+        self.handler = handler
+        self._server = await asyncio.start_server(self._serve_client, '0.0.0.0', self.port)
+        self._watcher = asyncio.create_task(self._watch_streams())
+        print('-- listening on', ('0.0.0.0', self.port))
+
+    async def _read_request(self, reader, buffer : bytearray) -> Request:
+        # reads the head, and any body, into buffer. returns None when the request is too large
+        view = memoryview(buffer)
+        length = 0
+        head = -1
+        while head < 0:
+            if length >= self.max_head:
+                return None
+            count = await _readinto(reader, view[length:self.max_head])
+            if not count:
+                raise EOFError('connection closed')
+            head = head_end(view, max(length - 2, 0), length + count)
+            length += count
+        request = Request(view[:head])
+        if request.length > self.max_body:
+            return None
+        end = head + request.length
+        while length < end:
+            count = await _readinto(reader, view[length:end])
+            if not count:
+                raise EOFError('connection closed')
+            length += count
+        if request.length > 0:
+            request.set_body(view[head:end])
+        return request
 
-    def listen(self, handler):
+    def publish(self, timestamp : int, readings : dict):
+        # a new sample for the streams, encoded once and shared by every subscriber
+        if len(self.subscribers) == 0:
+            return
+        event = b'data: ' + json.dumps({'timestamp': timestamp, 'readings': readings}).encode() + b'\n\n'
+        for stream in self.subscribers:
+            stream.queue.put(event)
+        self._last_event = ticks_ms()
+        self.published += 1
+
+    async def _watch_streams(self):
+        while True:
+            await asyncio.sleep(min(self.timeout, self.keepalive))
+            if len(self.subscribers) == 0:
+                continue
+            now = ticks_ms()
+            idle = ticks_diff(now, self._last_event) >= self.keepalive * 1000
+            for stream in self.subscribers:
+                if stream.writing is not None and ticks_diff(now, stream.writing) > self.timeout * 1000:
+                    stream.task.cancel()
+                elif idle:
+                    stream.queue.put(SSE_KEEPALIVE)
+            if idle:
+                self._last_event = now
+
+    async def _stream(self, writer):
+        if len(self.subscribers) >= self.max_streams:
+            self.rejected += 1
+            self._error(writer, '503 Service Unavailable')
+            await writer.drain()
+            return
+        stream = _Stream(self.stream_queue)
+        queue = stream.queue
+        self.subscribers.append(stream)
+        self.clients -= 1   # a stream holds its connection open, leave the slot for other requests
+        try:
+            writer.write(SSE_HEADERS)
+            while True:
+                stream.writing = ticks_ms()
+                await writer.drain()
+                stream.writing = None
+                writer.write(await queue.get())
+        except OSError:
+            pass    # client went away
+        except asyncio.CancelledError:
+            self.timeouts += 1  # stopped reading, cancelled by _watch_streams
+        finally:
+            self.clients += 1
+            self.subscribers.remove(stream)
+            self.stream_dropped += queue.dropped
+
+    def _error(self, writer, code : str):
+        writer.write(f'HTTP/1.0 {code}\r\nContent-Length: 0\r\n\r\n'.encode())
+
+    async def _serve_client(self, reader, writer):
         html = """<!DOCTYPE html>
             <html>
                 <head> <title>Solar Monitor</title><link rel="icon" href="./favicon.png"> </head>
@@ -55,56 +297,121 @@ class WebServer:
                 </body>
             </html>
         """
-        try: 
-            # Listen for connections
-            cl = None
-            while True:
+        self.clients += 1
+        buffer = None
+        try:
+            if self.clients > self.max_clients or len(self._buffers) == 0:
+                self.rejected += 1
+                self._error(writer, '503 Service Unavailable')
+                await writer.drain()
+                return
+            buffer = self._buffers.pop()
+            try:
+                request = await asyncio.wait_for(self._read_request(reader, buffer), self.timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                self._error(writer, '408 Request Timeout')
+                await writer.drain()
+                return
+            except ValueError:
+                self.rejected += 1
+                self._error(writer, '400 Bad Request')
+                await writer.drain()
+                return
+            if request is None:
+                self.rejected += 1
+                self._error(writer, '413 Content Too Large')
+                await writer.drain()
+                return
+
+            if request.command == '/favicon.png':
+                if not await self.static.serve(request, writer, self.timeout):
+                    self._error(writer, '404 Not Found')
+
+            elif request.command == '/api/stream':
+                self._buffers.append(buffer)    # the request is parsed, the stream doesn't need it
+                buffer = None
+                await self._stream(writer)
+                return
+
+            elif request.command == '/api/history':
                 try:
-                    cl, addr = self._socket.accept()
-                    request = Request(cl.recv(1024))
-                    
-                    if 'favicon.png' in request.command:
-                        with open("favicon.png", mode="rb") as favorite:
-                            contents = favorite.read()
-                        #print('content length',len(contents))
-                        cl.send(f'HTTP/1.0 200 OK\r\nContent-type: image/png\r\nContent-Length: {len(contents)}\r\n\r\n')
-                        cl.send(contents)
-
-                    else:
-                        print('-- client connected from', addr,request.verb,request.command)
-                        response = html
-                    
-                        if handler != None:
-                            handler(request, self.status)
-            
-                        cookie = "Set-Cookie: state=ready&location=test&delay=30; expires=Fri, 27-Dec-2023 10:57:36 GMT; Domain=192.168.86.24; Path=/"
-                        cl.send(f'HTTP/1.0 200 OK\r\nContent-type: text/html\r\n{cookie}\r\n\r\n')
-                        cl.send(response)
-
-                    cl.close()
-
-                except OSError as e:
-                    print_exception(e)
-                    if cl != None:
-                        cl.close()
-                        print('-- connection closed')
-                        cl = None
-                finally:
-                    if cl != None:
-                        cl.close()
-                        cl = None
-
-        except Exception as eouter:
-            print('-- exception, closing socket',eouter)
-            print_exception(eouter)
-            self._socket.close()
-        except KeyboardInterrupt as kbe:
-            print('-- keyboard exception, closing socket',kbe)
-            print_exception(kbe)
-            self._socket.close()
-            
+                    since = int(request.parameters['since']) if 'since' in request.parameters else None
+                    step = int(request.parameters.get('step', 0))
+                except ValueError:
+                    self._error(writer, '400 Bad Request')
+                else:
+                    body = self.status.get_history_json(since, step)
+                    writer.write(f'HTTP/1.0 200 OK\r\nContent-type: application/json\r\nCache-Control: no-cache\r\nContent-Length: {len(body)}\r\n\r\n'.encode())
+                    writer.write(body)
+
+            elif request.command == '/api/rollups':
+                try:
+                    body = self.status.get_rollups_json(request.parameters.get('tier', 'hour'))
+                except KeyError:
+                    self._error(writer, '404 Not Found')
+                else:
+                    writer.write(f'HTTP/1.0 200 OK\r\nContent-type: application/json\r\nCache-Control: no-cache\r\nContent-Length: {len(body)}\r\n\r\n'.encode())
+                    writer.write(body)
+
+            elif request.command == '/api/status':
+                body = self.status.get_status_json()
+                writer.write(f'HTTP/1.0 200 OK\r\nContent-type: application/json\r\nCache-Control: no-cache\r\nContent-Length: {len(body)}\r\n\r\n'.encode())
+                writer.write(body)
+
+            else:
+                print('-- client connected from', writer.get_extra_info('peername'),request.verb,request.command)
+
+                if self.handler != None:
+                    self.handler(request, self.status)
+
+                if request.command in self.static.files:
+                    if not await self.static.serve(request, writer, self.timeout):
+                        response = html.encode()
+                        writer.write(f'HTTP/1.0 200 OK\r\nContent-type: text/html\r\nContent-Length: {len(response)}\r\n\r\n'.encode())
+                        if request.verb != 'HEAD':
+                            writer.write(response)
+                else:
+                    # commands (/start, /stop, /config...) come from the page's forms, send the browser back to it
+                    writer.write(b'HTTP/1.0 303 See Other\r\nLocation: /\r\nContent-Length: 0\r\n\r\n')
+            await asyncio.wait_for(writer.drain(), self.timeout)
+            self.served += 1
+
+        except asyncio.TimeoutError:
+            self.timeouts += 1  # stopped reading the response
+        except (EOFError, OSError):
+            pass    # client went away (before finishing its request, or closed the connection on us)
+        except Exception as e:
+            print_exception(e)
+        finally:
+            self.clients -= 1
+            if buffer is not None:
+                self._buffers.append(buffer)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            'clients': self.clients,
+            'served': self.served,
+            'rejected': self.rejected,
+            'timeouts': self.timeouts,
+            'streams': len(self.subscribers),
+            'published': self.published,
+            'static': self.static.stats(),
+            'stream_dropped': self.stream_dropped + sum(stream.queue.dropped for stream in self.subscribers),
+        }
+
     def shutdown(self):
-        self._socket.close()    
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
 
 if __name__ == "__main__":
     print('server.py main')
@@ -122,12 +429,10 @@ if __name__ == "__main__":
 
     status = Status(_thread.allocate_lock())
 
-    server = WebServer(status)
-    server.listen(lambda r : r.command)
+    async def serve():
+        server = WebServer(status)
+        await server.start(lambda r, s : r.command)
+        while True:
+            await asyncio.sleep(60)
 
-    import time
-    import gc
-    gc.enable()
-    gc.collect()
-    del wifi
-    time.sleep(5)
\ No newline at end of file
+    asyncio.run(serve())
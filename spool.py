@@ -0,0 +1,218 @@
+import os
+
+# Store and forward log for line protocol records that could not be sent to influx.
+#
+# The log is a ring of segment files on flash, named by an increasing sequence number (spool/00000012.lp).
+# Records are appended to the newest segment, and replayed from the oldest one. When the ring is full
+# the oldest segment is deleted, so the log never grows past segments * segment_size bytes.
+#
+# Flash friendliness:
+#  - appends are collected in a block sized buffer and written a whole block at a time. sync() pads a
+#    partial block with newlines (blank lines are ignored by influx) so every write stays block aligned.
+#  - segments are never rewritten in place, a drained segment is deleted and the next one gets a new
+#    name, which lets the filesystem spread the writes over free blocks.
+# Replay streams the oldest segment through a fixed size buffer, the log is never loaded into memory.
+# A segment that was partly replayed before a reboot is replayed again from its start, which is
+# harmless since points carry their own timestamp and influx overwrites duplicates.
+class Spool:
+    def __init__(self, directory : str = 'spool', segment_size : int = 16384, segments : int = 8, block_size : int = 512):
+        self.directory = directory
+        self.block_size = block_size
+        self.segment_size = (segment_size // block_size) * block_size
+        self.segments = segments
+        self._block = bytearray(block_size)
+        self._fill = 0
+        self._chunk = bytearray(block_size * 2)
+        self._tail_offset = 0
+        self.spooled = 0
+        self.replayed = 0
+        self.dropped = 0
+
+        try:
+            os.mkdir(directory)
+        except OSError:
+            pass    # already exists
+        sequences = sorted(int(name[:-3]) for name in os.listdir(directory) if name.endswith('.lp'))
+        if len(sequences) > 0:
+            self._tail = sequences[0]
+            self._head = sequences[-1]
+        else:
+            self._tail = 0
+            self._head = 0
+        self._head_size = self._size(self._head)
+
+    def _path(self, sequence : int) -> str:
+        return f'{self.directory}/{sequence:08d}.lp'
+
+    def _size(self, sequence : int) -> int:
+        try:
+            return os.stat(self._path(sequence))[6]
+        except OSError:
+            return 0
+
+    def _write_block(self, length : int):
+        if self._head_size >= self.segment_size:
+            self._head += 1
+            self._head_size = 0
+            if self._head - self._tail >= self.segments:
+                # ring is full, drop the oldest segment
+                try:
+                    os.remove(self._path(self._tail))
+                except OSError:
+                    pass
+                self._tail += 1
+                self._tail_offset = 0
+                self.dropped += 1
+        with open(self._path(self._head), 'ab') as f:
+            f.write(memoryview(self._block)[:length])
+        self._head_size += length
+        self._fill = 0
+
+    def append(self, record):
+        # record is line protocol text (str or bytes), one or more lines
+        if isinstance(record, str):
+            record = record.encode()
+        data = memoryview(record)
+        total = len(data) + 1
+        position = 0
+        while position < len(data):
+            count = min(self.block_size - self._fill, len(data) - position)
+            self._block[self._fill:self._fill + count] = data[position:position + count]
+            self._fill += count
+            position += count
+            if self._fill == self.block_size:
+                self._write_block(self.block_size)
+        if len(data) == 0 or data[-1] != 0x0A:
+            self._block[self._fill] = 0x0A
+            self._fill += 1
+            if self._fill == self.block_size:
+                self._write_block(self.block_size)
+        else:
+            total -= 1
+        self.spooled += total
+
+    def sync(self):
+        # flush the partial block, padded with blank lines to keep the file block aligned
+        if self._fill > 0:
+            for i in range(self._fill, self.block_size):
+                self._block[i] = 0x0A
+            self._write_block(self.block_size)
+
+    def pending(self) -> int:
+        # bytes waiting to be replayed (including block padding)
+        pending = self._fill - self._tail_offset
+        for sequence in range(self._tail, self._head):
+            pending += self._size(sequence)
+        return pending + self._head_size
+
+    async def drain(self, write, max_chunks : int = 4) -> int:
+        # replay up to max_chunks buffers of the oldest records through async write(memoryview) -> bool
+        # stops at the first failed write, returns the number of bytes replayed
+        replayed = 0
+        chunks = 0
+        view = memoryview(self._chunk)
+        while chunks < max_chunks:
+            if self._tail == self._head:
+                self.sync()
+            try:
+                f = open(self._path(self._tail), 'rb')
+            except OSError:
+                f = None
+            if f is None:
+                if self._tail >= self._head:
+                    break   # nothing spooled
+                self._tail += 1
+                self._tail_offset = 0
+                continue
+            try:
+                f.seek(self._tail_offset)
+                count = f.readinto(self._chunk)
+            finally:
+                f.close()
+            if not count:
+                # segment fully replayed
+                if self._tail == self._head:
+                    os.remove(self._path(self._tail))
+                    self._head_size = 0
+                    self._tail_offset = 0
+                    break
+                os.remove(self._path(self._tail))
+                self._tail += 1
+                self._tail_offset = 0
+                continue
+            # only send whole lines, the rest is read again next time
+            end = count
+            while end > 0 and self._chunk[end - 1] != 0x0A:
+                end -= 1
+            if end == 0:
+                end = count     # line longer than the buffer, can't be sent, skip it
+            else:
+                start = 0
+                while start < end and self._chunk[start] == 0x0A:
+                    start += 1  # skip padding
+                stop = end
+                while stop > start and self._chunk[stop - 1] == 0x0A:
+                    stop -= 1
+                if start < stop and not await write(view[start:stop]):
+                    break
+                replayed += self._record_bytes(start, stop)
+            self._tail_offset += end
+            chunks += 1
+        self.replayed += replayed
+        return replayed
+
+    def _record_bytes(self, start : int, stop : int) -> int:
+        # bytes of the records in chunk[start:stop] with their newlines, not the padding between them,
+        # so replayed counts the same bytes as spooled
+        if start >= stop:
+            return 0
+        count = 1   # the last record's newline, just past stop
+        chunk = self._chunk
+        previous = 0
+        for i in range(start, stop):
+            byte = chunk[i]
+            if byte != 0x0A or previous != 0x0A:
+                count += 1
+            previous = byte
+        return count
+
+    def stats(self) -> dict:
+        return {
+            'pending_bytes': self.pending(),
+            'spooled': self.spooled,
+            'replayed': self.replayed,
+            'dropped_segments': self.dropped,
+        }
+
+if __name__ == "__main__":
+    # outage and recovery against the host fake influx endpoint
+    #   PYTHONPATH=.:host python3 spool.py
+    import asyncio
+    from fake_influx import FakeInflux
+    from influxdb_api_client import InfluxApiClient, BatchWriter, Point
+
+    async def outage():
+        influx = FakeInflux(0).start()
+        client = InfluxApiClient(influx.url, 'host', 'solar', 'host')
+        spool = Spool('spool-test', segment_size=4096, segments=4)
+        writer = BatchWriter(client, max_points=10, spool=spool)
+
+        influx.fail = True
+        tags = (('location','test'),)
+        for i in range(200):
+            writer.add([Point('voltage', tags, i, client.timestamp())])
+            if writer.due():
+                await writer.flush()
+        print('outage  ', writer.stats())
+
+        influx.fail = False
+        writer.add([Point('voltage', tags, -1, client.timestamp())])
+        await writer.flush()
+        while spool.pending() > 0 and await writer.drain() > 0:
+            pass
+        print('recovery', writer.stats())
+        print(f'influx received {influx.lines} lines in {influx.requests} requests')
+        client.close()
+        influx.stop()
+
+    asyncio.run(outage())
@@ -22,19 +22,131 @@ SET_PRECHARGE = const(0xD9)
 SET_VCOM_DESEL = const(0xDB)
 SET_CHARGE_PUMP = const(0x8D)
  
+# bytes of commands sent to set the window for a partial update, a region only pays off when it saves more
+REGION_COST = const(8)
+
 # Subclassing FrameBuffer provides support for graphics primitives
 # http://docs.micropython.org/en/latest/pyboard/library/framebuf.html
+#
+# Partial updates: the drawing primitives record which columns of each page (8 pixel rows) they
+# touched, and show() only sends those column ranges, a page at a time, instead of the whole buffer.
+# With diff=True a shadow copy of what the panel shows is kept as well, and each dirty range is
+# narrowed down to the bytes that actually differ, so redrawing a screen that is mostly unchanged
+# (fill(0) then the same labels again) only sends the digits that changed. When the partial update
+# would be as large as the whole buffer, or after show(full=True), the full buffer is sent.
 class SSD1306(framebuf.FrameBuffer):
-    def __init__(self, width, height, external_vcc):
+    def __init__(self, width, height, external_vcc, diff=False):
         self.width = width
         self.height = height
         self.external_vcc = external_vcc
         self.pages = self.height // 8
         self.buffer = bytearray(self.pages * self.width)
+        self._view = memoryview(self.buffer)
+        self._shadow = bytearray(len(self.buffer)) if diff else None
+        self._low = bytearray(self.pages)   # dirty column range per page, clean when low > high
+        self._high = bytearray(self.pages)
+        self._window = bytearray(7)
+        self._full = True
+        self.updates = 0
+        self.full_updates = 0
+        self.regions = 0
+        self.bytes_sent = 0
         super().__init__(self.buffer, self.width, self.height, framebuf.MONO_VLSB)
         self.init_display()
+
+    def _clean(self):
+        for page in range(self.pages):
+            self._low[page] = 255
+            self._high[page] = 0
+        self._full = False
+
+    def _dirty(self, x0, y0, x1, y1):
+        # marks the pixel rectangle x0..x1, y0..y1 (inclusive) as changed
+        if x1 < x0:
+            x0, x1 = x1, x0
+        if y1 < y0:
+            y0, y1 = y1, y0
+        if x1 < 0 or y1 < 0 or x0 >= self.width or y0 >= self.height:
+            return
+        x0 = max(x0, 0)
+        x1 = min(x1, self.width - 1)
+        for page in range(max(y0, 0) >> 3, (min(y1, self.height - 1) >> 3) + 1):
+            if x0 < self._low[page]:
+                self._low[page] = x0
+            if x1 > self._high[page]:
+                self._high[page] = x1
+
+    def fill(self, c):
+        super().fill(c)
+        self._dirty(0, 0, self.width - 1, self.height - 1)
+
+    def pixel(self, x, y, c=None):
+        if c is None:
+            return super().pixel(x, y)
+        super().pixel(x, y, c)
+        self._dirty(x, y, x, y)
+
+    def hline(self, x, y, w, c):
+        super().hline(x, y, w, c)
+        self._dirty(x, y, x + w - 1, y)
+
+    def vline(self, x, y, h, c):
+        super().vline(x, y, h, c)
+        self._dirty(x, y, x, y + h - 1)
+
+    def line(self, x1, y1, x2, y2, c):
+        super().line(x1, y1, x2, y2, c)
+        self._dirty(x1, y1, x2, y2)
+
+    def rect(self, x, y, w, h, c, f=False):
+        super().rect(x, y, w, h, c, f)
+        self._dirty(x, y, x + w - 1, y + h - 1)
+
+    def fill_rect(self, x, y, w, h, c):
+        super().fill_rect(x, y, w, h, c)
+        self._dirty(x, y, x + w - 1, y + h - 1)
+
+    def text(self, s, x, y, c=1):
+        super().text(s, x, y, c)
+        self._dirty(x, y, x + 8 * len(s) - 1, y + 7)
+
+    def ellipse(self, x, y, xr, yr, c, f=False, m=0b1111):
+        super().ellipse(x, y, xr, yr, c, f, m)
+        self._dirty(x - xr, y - yr, x + xr, y + yr)
+
+    def poly(self, x, y, coords, c, f=False):
+        super().poly(x, y, coords, c, f)
+        if len(coords) < 2:
+            return
+        x0 = x1 = coords[0]
+        y0 = y1 = coords[1]
+        for i in range(2, len(coords) - 1, 2):
+            px = coords[i]
+            py = coords[i + 1]
+            if px < x0:
+                x0 = px
+            elif px > x1:
+                x1 = px
+            if py < y0:
+                y0 = py
+            elif py > y1:
+                y1 = py
+        self._dirty(x + x0, y + y0, x + x1, y + y1)
+
+    def scroll(self, xstep, ystep):
+        super().scroll(xstep, ystep)
+        self._full = True
+
+    def blit(self, fbuf, x, y, key=-1, palette=None):
+        # the source size isn't known here, so anything could have changed
+        if palette is None:
+            super().blit(fbuf, x, y, key)
+        else:
+            super().blit(fbuf, x, y, key, palette)
+        self._full = True
  
     def init_display(self):
+        self._full = True   # the panel memory is unknown after a reset, whatever the shadow says
         for cmd in (
             SET_DISP | 0x00,  # off
             # address setting
@@ -84,42 +196,101 @@ class SSD1306(framebuf.FrameBuffer):
     def invert(self, invert):
         self.write_cmd(SET_NORM_INV | (invert & 1))
  
-    def show(self):
-        x0 = 0
-        x1 = self.width - 1
-        if self.width == 64:
-            # displays with width of 64 pixels are shifted by 32
-            x0 += 32
-            x1 += 32
-        self.write_cmd(SET_COL_ADDR)
-        self.write_cmd(x0)
-        self.write_cmd(x1)
-        self.write_cmd(SET_PAGE_ADDR)
-        self.write_cmd(0)
-        self.write_cmd(self.pages - 1)
-        self.write_data(self.buffer)
- 
- 
+    def _send(self, x0, x1, page0, page1):
+        # sets the window to columns x0..x1 of pages page0..page1 and sends that part of the buffer
+        window = self._window
+        offset = 32 if self.width == 64 else 0  # displays with width of 64 pixels are shifted by 32
+        window[0] = 0x00    # Co=0, D/C#=0, the rest are commands
+        window[1] = SET_COL_ADDR
+        window[2] = x0 + offset
+        window[3] = x1 + offset
+        window[4] = SET_PAGE_ADDR
+        window[5] = page0
+        window[6] = page1
+        self.write_cmds(window)
+        if page0 == page1:
+            start = page0 * self.width
+            data = self._view[start + x0:start + x1 + 1]
+        else:
+            data = self._view   # only used for the whole buffer
+        self.write_data(data)
+        self.bytes_sent += len(data)
+
+    def show(self, full=False):
+        self.updates += 1
+        width = self.width
+        total = 0
+        if not (full or self._full):
+            # narrow each page's dirty range, and work out what a partial update would cost
+            shadow = self._shadow
+            buffer = self.buffer
+            for page in range(self.pages):
+                low = self._low[page]
+                high = self._high[page]
+                if low > high:
+                    continue
+                if shadow is not None:
+                    start = page * width
+                    while low <= high and buffer[start + low] == shadow[start + low]:
+                        low += 1
+                    while high >= low and buffer[start + high] == shadow[start + high]:
+                        high -= 1
+                    self._low[page] = low
+                    self._high[page] = high
+                    if low > high:
+                        continue
+                total += high - low + 1 + REGION_COST
+        if full or self._full or total >= len(self.buffer):
+            self._send(0, width - 1, 0, self.pages - 1)
+            if self._shadow is not None:
+                self._shadow[:] = self.buffer
+            self.full_updates += 1
+        else:
+            for page in range(self.pages):
+                low = self._low[page]
+                high = self._high[page]
+                if low > high:
+                    continue
+                self._send(low, high, page, page)
+                if self._shadow is not None:
+                    start = page * width
+                    self._shadow[start + low:start + high + 1] = self._view[start + low:start + high + 1]
+                self.regions += 1
+        self._clean()
+
+    def stats(self) -> dict:
+        return {
+            'updates': self.updates,
+            'full_updates': self.full_updates,
+            'regions': self.regions,
+            'bytes_sent': self.bytes_sent,
+        }
+
+
 class SSD1306_I2C(SSD1306):
-    def __init__(self, width, height, i2c, addr=0x3C, external_vcc=False):
+    def __init__(self, width, height, i2c, addr=0x3C, external_vcc=False, diff=False):
         self.i2c = i2c
         self.addr = addr
         self.temp = bytearray(2)
         self.write_list = [b"\x40", None]  # Co=0, D/C#=1
-        super().__init__(width, height, external_vcc)
+        super().__init__(width, height, external_vcc, diff)
  
     def write_cmd(self, cmd):
         self.temp[0] = 0x80  # Co=1, D/C#=0
         self.temp[1] = cmd
         self.i2c.writeto(self.addr, self.temp)
  
+    def write_cmds(self, buf):
+        # buf[0] is the control byte (0x00), the rest are commands sent in one transfer
+        self.i2c.writeto(self.addr, buf)
+
     def write_data(self, buf):
         self.write_list[1] = buf
         self.i2c.writevto(self.addr, self.write_list)
  
  
 class SSD1306_SPI(SSD1306):
-    def __init__(self, width, height, spi, dc, res, cs, external_vcc=False):
+    def __init__(self, width, height, spi, dc, res, cs, external_vcc=False, diff=False):
         self.rate = 10 * 1024 * 1024
         dc.init(dc.OUT, value=0)
         res.init(res.OUT, value=0)
@@ -135,7 +306,7 @@ class SSD1306_SPI(SSD1306):
         self.res(0)
         time.sleep_ms(10)
         self.res(1)
-        super().__init__(width, height, external_vcc)
+        super().__init__(width, height, external_vcc, diff)
  
     def write_cmd(self, cmd):
         self.spi.init(baudrate=self.rate, polarity=0, phase=0)
@@ -145,6 +316,14 @@ class SSD1306_SPI(SSD1306):
         self.spi.write(bytearray([cmd]))
         self.cs(1)
  
+    def write_cmds(self, buf):
+        self.spi.init(baudrate=self.rate, polarity=0, phase=0)
+        self.cs(1)
+        self.dc(0)
+        self.cs(0)
+        self.spi.write(memoryview(buf)[1:])  # no control byte on SPI
+        self.cs(1)
+
     def write_data(self, buf):
         self.spi.init(baudrate=self.rate, polarity=0, phase=0)
         self.cs(1)
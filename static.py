@@ -0,0 +1,84 @@
+import asyncio
+import os
+import binascii
+
+# Static files (the page and its icon) served from flash.
+#
+# A file is sent in chunk_size pieces through one buffer shared by all requests (the stream writer
+# copies each piece before the next await), so a large file never has to fit in memory. Each file gets an ETag (crc32 of its contents, worked out on its first request),
+# a browser that already has the current version gets a 304 without the file being read. Where the
+# packaging step (host/package_site.py) left a pre-compressed name.gz next to a file, that is sent
+# instead to browsers that accept gzip.
+FILES = {
+    # path: (file, content type, cache control)
+    '/': ('index.html', 'text/html', 'no-cache'),
+    '/index.html': ('index.html', 'text/html', 'no-cache'),
+    '/favicon.png': ('favicon.png', 'image/png', 'max-age=604800'),
+}
+
+class StaticFiles:
+    def __init__(self, root : str = '.', files : dict = None, chunk_size : int = 512):
+        self.root = root
+        self.files = FILES if files is None else files
+        self._buffer = bytearray(chunk_size)
+        self._view = memoryview(self._buffer)
+        self._etags = {}    # file name: (size, etag)
+        self.sent = 0
+        self.not_modified = 0
+        self.bytes = 0
+
+    def _stat(self, name : str) -> tuple[int, str]:
+        # (size, etag) of a file, None when it doesn't exist
+        if name not in self._etags:
+            try:
+                size = os.stat(f'{self.root}/{name}')[6]
+            except OSError:
+                return None
+            crc = 0
+            with open(f'{self.root}/{name}', 'rb') as f:
+                while True:
+                    count = f.readinto(self._buffer)
+                    if not count:
+                        break
+                    crc = binascii.crc32(self._view[:count], crc)
+            self._etags[name] = (size, f'"{crc:08x}-{size:x}"')
+        return self._etags[name]
+
+    async def serve(self, request, writer, timeout : float = 5) -> bool:
+        # returns False when the file isn't there. A client that takes longer than timeout seconds to
+        # accept a chunk raises asyncio.TimeoutError, so it can't hold on to its connection. A HEAD
+        # request gets the headers only
+        name, content_type, cache_control = self.files[request.command]
+        encoding = ''
+        if 'gzip' in request.header('Accept-Encoding') and self._stat(name + '.gz') is not None:
+            name += '.gz'
+            encoding = 'Content-Encoding: gzip\r\n'
+        found = self._stat(name)
+        if found is None:
+            return False
+        size, etag = found
+        headers = f'ETag: {etag}\r\nCache-Control: {cache_control}\r\nVary: Accept-Encoding\r\n'
+        if request.header('If-None-Match') == etag:
+            writer.write(f'HTTP/1.0 304 Not Modified\r\n{headers}\r\n'.encode())
+            self.not_modified += 1
+            return True
+        writer.write(f'HTTP/1.0 200 OK\r\nContent-type: {content_type}\r\nContent-Length: {size}\r\n{encoding}{headers}\r\n'.encode())
+        if request.verb == 'HEAD':
+            return True
+        with open(f'{self.root}/{name}', 'rb') as f:
+            while True:
+                count = f.readinto(self._buffer)
+                if not count:
+                    break
+                writer.write(self._view[:count])
+                await asyncio.wait_for(writer.drain(), timeout)
+                self.bytes += count
+        self.sent += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            'sent': self.sent,
+            'not_modified': self.not_modified,
+            'bytes': self.bytes,
+        }
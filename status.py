@@ -1,97 +1,226 @@
 import time
+import json
 import _thread
-from influxdb_api_client import InfluxApiClient
+from influxdb_api_client import InfluxApiClient, BatchWriter, timestamp as unix_time
+from spool import Spool
+from scheduler import Scheduler
+from energy import EnergyCounter
+from adaptive import AdaptiveRate
+from deadband import Deadband
+from history import History
+from rollups import Rollups
 from secrets import influxdb as influxdb_secrets
 from machine import ADC, mem32, Pin
 
-class Data:
-    def __init__(self, timestamp, voltage : float, current : float, power : float, temperature : float):
-        self.timestamp = timestamp
-        self.voltage = voltage
-        self.current = current
-        self.power = power
-        self.temperature = temperature
+# Status is read far more often than it changes (every sample, web request and display refresh reads
+# the config or state), so everything the monitor is doing is kept in one Snapshot that is never
+# modified. A change builds a new snapshot and swaps the reference in one assignment, so readers just
+# take self.snapshot and never need the lock, and always see a consistent set of values. The lock
+# only keeps writers from losing each other's changes.
+# The helper objects (scheduler, writer, energy, history...) belong to the asyncio tasks, which all
+# run on one thread, their stats are read without the lock as well.
+class Snapshot:
+    def __init__(self, state : str, location : str, delay : int, settings : dict, data_count : int = 0,
+                 last_timestamp : int = None, last_time : tuple = None, last_readings : dict = None):
+        self.state = state
+        self.location = location
+        self.delay = delay
+        self.settings = settings            # shared between snapshots, never modified, a change makes a new dict
+        self.data_count = data_count
+        self.last_timestamp = last_timestamp
+        self.last_time = last_time
+        self.last_readings = last_readings
+
+    def replace(self, **changes):
+        fields = {'state': self.state, 'location': self.location, 'delay': self.delay, 'settings': self.settings,
+                  'data_count': self.data_count, 'last_timestamp': self.last_timestamp, 'last_time': self.last_time,
+                  'last_readings': self.last_readings}
+        fields.update(changes)
+        return Snapshot(**fields)
 
 class Status:
     def __init__(self, _lock : _thread.LockType, location : str = 'test', delay : int = 30, state : str = 'waiting'):
         self.lock = _lock
-        self.location = location
-        self.delay = delay
-        self.state = state
+        self.adc_lock = _thread.allocate_lock()  # the ADC reads, so they don't hold up anything else
         self.foo = time.localtime()
         self.starttime = time.localtime()
         self.endtime = time.localtime()
-        self.data = {}
-        self.data_count = 0
-        self.influxdbclient = InfluxApiClient(influxdb_secrets['url'],influxdb_secrets['organization'],influxdb_secrets['bucket'],influxdb_secrets['token'])
-        
-    def update_config(self, location, delay):
-        self.lock.acquire()
-        self.location = location
-        self.delay = delay
-        self.lock.release()
-        
-    def update_state(self, state):
+        self.history = History()
+        self.rollups = Rollups()
+        self._status_json = (None, None)    # (snapshot, its part of the /api/status body) cached for the current snapshot
+        settings = {
+            'batch_points': 70,     # flush once this many points are pending
+            'batch_bytes': 4096,    # or once the pending line protocol reaches this size
+            'batch_age': 60,        # or once the oldest pending point is this many seconds old
+            'layout': influxdb_secrets.get('layout', 'legacy'),  # 'legacy' measurement per reading, or 'fields' one solar measurement
+            'gzip_min': 0,          # gzip write bodies of at least this many bytes, 0 sends plain text
+            'adaptive': 0,          # 1 lengthens the sample interval (up to max_delay) while readings are stable or the battery is low
+            'max_delay': 300,       # longest adaptive sample interval, seconds
+            'low_battery': 30,      # battery percentage below which adaptive sampling slows down
+            'deadband': 0,          # 1 only uploads readings that changed (see Deadband), plus a heartbeat
+            'heartbeat': 10,        # with deadband, every reading is uploaded at least once in this many samples
+            'oversample': 1,        # INA219 reads per sample interval (up to 64), 1 reads once at the sample
+            'averaging': 128,       # INA219 conversions averaged in hardware per read, 1 to 128 in powers of 2
+            'display_timeout': 120, # seconds without a button press before the display is turned off, 0 leaves it on
+        }
+        self.snapshot = Snapshot(state, location, delay, settings)
+        self.influxdbclient = InfluxApiClient(influxdb_secrets['url'],influxdb_secrets['organization'],influxdb_secrets['bucket'],influxdb_secrets['token'],influxdb_secrets.get('precision','ms'))
+        self.scheduler = Scheduler(delay * 1000)
+        self.energy = EnergyCounter()
+        self.deadband = Deadband(heartbeat=settings['heartbeat'])
+        self.adaptive = AdaptiveRate(delay, settings['max_delay'], low_battery=settings['low_battery'])
+        self.dashboard = None       # Dashboard and Button, set by main when there is a display
+        self.button = None
+        self.bus = None             # I2CBus and INASampler, set by main
+        self.sensor = None
+        self.influxwriter = BatchWriter(self.influxdbclient, settings['batch_points'], settings['batch_bytes'], settings['batch_age'], spool=Spool())
+
+    @property
+    def state(self) -> str:
+        return self.snapshot.state
+
+    @property
+    def location(self) -> str:
+        return self.snapshot.location
+
+    @property
+    def delay(self) -> int:
+        return self.snapshot.delay
+
+    def _update(self, **changes):
         self.lock.acquire()
-        self.state = state
+        self.snapshot = self.snapshot.replace(**changes)
         self.lock.release()
-        
-    def record_data(self, timestamp, voltage : float, current : float, power : float, temperature : float):
+
+    def update_config(self, location, delay):
+        self._update(location=location, delay=delay)
+
+    def update_settings(self, settings : dict):
         self.lock.acquire()
-        self.data[time.mktime(timestamp)] = Data(timestamp, voltage, current, power, temperature)
-        self.data_count += 1
+        merged = dict(self.snapshot.settings)
+        merged.update(settings)
+        self.snapshot = self.snapshot.replace(settings=merged)
         self.lock.release()
-        
+        self.influxwriter.configure(merged['batch_points'], merged['batch_bytes'], merged['batch_age'])
+        self.influxdbclient.compress_min = merged['gzip_min']
+        self.deadband.heartbeat = merged['heartbeat']
+
+    def update_bands(self, bands : dict):
+        # {reading: (absolute, relative)}
+        for name, (absolute, relative) in bands.items():
+            self.deadband.set_band(name, absolute, relative)
+
+    def get_settings(self) -> dict:
+        # not a copy, don't change it, use update_settings
+        return self.snapshot.settings
+
+    def get_schedule_stats(self) -> dict:
+        return self.scheduler.stats()
+
+    def get_adaptive_stats(self) -> dict:
+        return self.adaptive.stats()
+
+    def get_deadband_stats(self) -> dict:
+        return self.deadband.stats()
+
+    def get_energy_stats(self) -> dict:
+        return self.energy.stats()
+
+    def get_flush_stats(self) -> dict:
+        return self.influxwriter.stats()
+
+    def get_sensor_stats(self) -> dict:
+        return self.sensor.stats() if self.sensor is not None else None
+
+    def get_i2c_stats(self) -> dict:
+        return self.bus.stats() if self.bus is not None else None
+
+    def get_display_stats(self) -> dict:
+        # None without a display
+        if self.dashboard is None:
+            return None
+        stats = self.dashboard.stats()
+        if self.button is not None:
+            stats.update(self.button.stats())
+        return stats
+
+    def update_state(self, state):
+        self._update(state=state)
+
+    def record_sample(self, timestamp : int, readings : dict):
+        # latest sample, for the status api
+        self._update(last_timestamp=timestamp, last_time=time.localtime(), last_readings=readings)
+        seconds = unix_time('s')
+        self.history.add(seconds, readings)
+        self.rollups.add(seconds, readings)
+
+    def get_history_json(self, since : int = None, step : int = 0) -> bytes:
+        return json.dumps(self.history.query(since, step)).encode()
+
+    def get_rollups_json(self, tier : str) -> bytes:
+        # KeyError for an unknown tier
+        return json.dumps(self.rollups.query(tier)).encode()
+
+    def save_rollups(self):
+        self.rollups.save()
+
+    def get_status_json(self) -> bytes:
+        # the /api/status body. The snapshot part (state, config, latest sample) is formatted at most once
+        # per snapshot, the counters of the helpers (influx, sampling, display...) change without a new
+        # snapshot, so they are formatted on every poll and joined on to it. Neither touches the sensors
+        snapshot = self.snapshot
+        cached, head = self._status_json
+        if cached is not snapshot:
+            sampled = None
+            if snapshot.last_time is not None:
+                t = snapshot.last_time
+                sampled = f'{t[0]}-{t[1]:02d}-{t[2]:02d} {t[3]:02d}:{t[4]:02d}:{t[5]:02d}'
+            head = json.dumps({
+                'state': snapshot.state,
+                'location': snapshot.location,
+                'delay': snapshot.delay,
+                'settings': snapshot.settings,
+                'count': snapshot.data_count,
+                'timestamp': snapshot.last_timestamp,
+                'time': sampled,
+                'readings': snapshot.last_readings,
+                'freemem': snapshot.last_readings['freemem'] if snapshot.last_readings is not None else None,
+            }).encode()[:-1]    # without the closing brace
+            self._status_json = (snapshot, head)
+        live = json.dumps({
+            'influx': self.influxwriter.stats(),
+            'sampling': self.scheduler.stats(),
+            'energy': self.energy.stats(),
+            'display': self.get_display_stats(),
+            'ina219': self.get_sensor_stats(),
+            'i2c': self.get_i2c_stats(),
+        }).encode()
+        return head + b', ' + live[1:]
+
     def get_state(self) -> str:
-        self.lock.acquire()
-        state = self.state
-        self.lock.release()
-        return state
+        return self.snapshot.state
 
     def get_config(self) -> tuple[str,int]:
-        self.lock.acquire()
-        location = self.location
-        delay = self.delay
-        self.lock.release()
-        return location, delay
-    
-    def get_data(self, clear=False) -> dict:
-        self.lock.acquire()
-        data = self.data
-        if clear:
-            self.data = {}
-        self.lock.release()
-        return data
-        
+        snapshot = self.snapshot
+        return snapshot.location, snapshot.delay
+
     def get_data_count(self) -> int:
-        self.lock.acquire()
-        count = self.data_count
-        self.lock.release()
-        return count
+        return self.snapshot.data_count
 
-    def reset_data(self):
-        self.lock.acquire()
-        data = self.data
-        self.data = {}
-        self.lock.release()
-        return data
-        
     def reset_counter(self):
-        self.lock.acquire()
-        self.data_count = 0
-        self.lock.release()
-        
+        self._update(data_count=0)
+
     def increment_counter(self) -> int:
         self.lock.acquire()
-        self.data_count += 1
-        count = self.data_count
+        snapshot = self.snapshot.replace(data_count=self.snapshot.data_count + 1)
+        self.snapshot = snapshot
         self.lock.release()
-        return count
-        
+        return snapshot.data_count
+
     def get_pi_temp(self, celsius : bool = False) -> float:
         #return 0.0
         try:
-            self.lock.acquire()
+            self.adc_lock.acquire()
             #print('open adc(4)')
             sensor_temp = ADC(4)
             conversion_factor = 3.3 / (1 << 16)
@@ -109,7 +238,7 @@ class Status:
             print("Error getting temp\n%s" % e)
             return 0.0
         finally:
-            self.lock.release()
+            self.adc_lock.release()
 
     def setPad(self, gpio, value):
         mem32[0x4001c000 | (4+ (4 * gpio))] = value
@@ -121,7 +250,7 @@ class Status:
     # 3.75v Li 3.0 to 4.2
     def get_battery_voltage(self, min : float, max : float, samples : int = 3, adc_channel : int = 3) -> tuple[float, float]:
         #return 5.0, 100.0
-        self.lock.acquire()
+        self.adc_lock.acquire()
     
         now = time.localtime()
         print(f'{now[3]}:{now[4]}:{now[5]} - get vsys on {adc_channel} ')
@@ -162,7 +291,7 @@ class Status:
                 print(f'vsys finally restore pad {oldpad29} from {self.getPad(29)}')
                 self.setPad(29,oldpad29)
                 print(f'vsys finally pad 29 now {self.getPad(29)}')
-            self.lock.release()
+            self.adc_lock.release()
     
     # Because I've been having problems on the pico-w getting vsys using ADC3, with various implementations, it will 
     # eventually hang for reasons unknown, likely due to conflict with the network chip.
@@ -175,7 +304,7 @@ class Status:
     # AA 1.35 to 1.5 volts (x3 = 4.05 to 4.5)
     # 3.75v Li 3.0 to 4.2
     def get_vsys_adc2(self, min : float, max : float, diode_drop : int = .2, samples : int = 3) -> tuple[float, float]:
-        self.lock.acquire()
+        self.adc_lock.acquire()
         try:
             vsys = ADC(2)
             gnd = ADC(1)
@@ -195,10 +324,10 @@ class Status:
         except Exception as e:
             return 0.0
         finally:
-            self.lock.release()
+            self.adc_lock.release()
 
     def status_blink(self, count : int = 1, toggle_delay : float = .2, end_delay : float = 2):
-        self.lock.acquire()
+        # no lock, nothing else uses the LED and there is nothing to keep consistent
         led = Pin("LED", Pin.OUT)
         
         for repeat in range(count):
@@ -208,5 +337,4 @@ class Status:
             if repeat < count:
                 time.sleep(toggle_delay)
         time.sleep(end_delay)
-        self.lock.release()
         return